@@ -0,0 +1,126 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from deedsBCVLib.backends import (
+    DESCRIPTION_FILENAME,
+    ENV_BIN_DIR,
+    BackendRegistry,
+    ExecutableBackend,
+)
+from deedsBCVLib.logic import deedsBCVLogic
+
+
+class BackendsTest(unittest.TestCase):
+    def setUp(self):
+        self._env = os.environ.get(ENV_BIN_DIR)
+        self.folders = []
+
+    def tearDown(self):
+        if self._env is None:
+            os.environ.pop(ENV_BIN_DIR, None)
+        else:
+            os.environ[ENV_BIN_DIR] = self._env
+
+    def _folder(
+        self, description=None, executables=('linear', 'deeds'), folder=None
+    ):
+        if folder is None:
+            folder = tempfile.mkdtemp()
+            self.addCleanup(shutil.rmtree, folder)
+        os.makedirs(folder, exist_ok=True)
+        for exe in executables:
+            open(os.path.join(folder, exe), 'w').close()
+
+        if description is not None:
+            with open(os.path.join(folder, DESCRIPTION_FILENAME), 'w') as fp:
+                fp.write(description)
+
+        self.folders.append(folder)
+        return folder
+
+    def _discover(self):
+        os.environ[ENV_BIN_DIR] = os.pathsep.join(self.folders)
+        return BackendRegistry().discover(tempfile.gettempdir())
+
+    def test_description(self):
+        folder = self._folder(
+            json.dumps({'name': 'fast', 'capabilities': ['avx2'], 'cost': 1})
+        )
+        backend = ExecutableBackend.from_folder(folder)
+
+        self.assertEqual(backend.name, 'fast')
+        self.assertEqual(
+            backend.capabilities,
+            {'linear', 'deformable', 'avx2'},
+        )
+
+    def test_invalid_descriptions_are_skipped(self):
+        for description in (
+            '{"name": ',
+            '[]',
+            '{"unknown": 1}',
+            '{"cost": "cheap"}',
+            '{"cost": true}',
+            '{"capabilities": ["avx2", 2]}',
+            '{"overhead": -1}',
+        ):
+            folder = self._folder(description)
+            with self.assertRaises(ValueError):
+                ExecutableBackend.from_folder(folder)
+
+        valid = self._folder(executables=('linear', 'deeds', 'applyBCV'))
+        with self.assertLogs(level='WARNING'):
+            registry = self._discover()
+
+        found = [x.binDir for x in registry.executables()]
+        self.assertEqual([x for x in found if x in self.folders], [valid])
+
+    def test_bundled_and_installed(self):
+        """`script_path` is <root>/qt-scripted-modules/deedsBCVLib, as once
+        installed, so the executables are in <root> (and the bundled ones in
+        <root>/bundled/libs)"""
+
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        script_path = os.path.join(root, 'qt-scripted-modules', 'deedsBCVLib')
+        os.makedirs(script_path)
+
+        bundled = os.path.join(root, 'bundled', 'libs')
+        self._folder('{"name": "avx2"}', folder=os.path.join(bundled, 'avx2'))
+        self._folder('{"name": "generic"}', folder=bundled)
+        self._folder('{"name": "installed"}', folder=root)
+
+        os.environ[ENV_BIN_DIR] = ''
+        registry = BackendRegistry().discover(script_path)
+
+        names = [x.name for x in registry.executables()]
+        self.assertEqual(names[:3], ['generic', 'avx2', 'installed'])
+
+    def test_bin_folder(self):
+        """outside of a job, the folder of the backend cheapest now, with
+        applyBCV only if needed"""
+
+        logic = deedsBCVLogic()
+        logic.backends = BackendRegistry()
+        cheap = logic.backends.register(
+            ExecutableBackend(self._folder(), overhead=0.1)
+        )
+        full = logic.backends.register(
+            ExecutableBackend(
+                self._folder(executables=('linear', 'deeds', 'applyBCV')),
+                overhead=1.0,
+            )
+        )
+
+        self.assertEqual(logic.get_bin_folder(), cheap.binDir)
+        self.assertEqual(logic.get_bin_folder({'apply'}), full.binDir)
+
+        full.overhead = 0.0  # e.g benchmarked
+        self.assertEqual(logic.get_bin_folder(), full.binDir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,195 @@
+import sys
+import threading
+import time
+import unittest
+
+import numpy as np
+from deedsBCVLib.coalescing import (
+    RequestCoalescer,
+    RequestSupersededError,
+    request_key,
+)
+from deedsBCVLib.logic import deedsBCVLogic
+from deedsBCVLib.utils import create_sub_process
+
+
+def _volume(value):
+    return np.full((4, 4, 4), value, dtype=np.float32), None
+
+
+class ProcessCoalescingTest(unittest.TestCase):
+    def setUp(self):
+        self.logic = deedsBCVLogic()
+        self.logs = []
+        self.logic.logCallback = self.logs.append
+
+        self.runs = []  # executed requests, in order
+        self.nested = []  # results of the calls made while polling
+
+        def _process_once(tempDir, fixed, moving, *args):
+            self.runs.append(int(moving[0][0, 0, 0]))
+            time.sleep(0.3)
+            return 'folder', f'pred {self.runs[-1]}'
+
+        self.logic._process_once = _process_once
+
+    def _process(self, value, group=None):
+        return self.logic.process(
+            _volume(0), _volume(value), requestGroup=group
+        )
+
+    def _call_while_polling(self, *calls):
+        """the polls (e.g GUI clicks) once a request is running make `calls`,
+        one each"""
+
+        poll = self.logic._poll_events
+        calls = list(calls)
+
+        def _poll():
+            if calls and self.runs:
+                self.nested.append(calls.pop(0)())
+            poll()
+
+        self.logic._poll_events = _poll
+
+    def test_same_thread_identical(self):
+        self._call_while_polling(lambda: self._process(1))
+
+        self.assertEqual(self._process(1), ('folder', 'pred 1'))
+        self.assertEqual(self.nested, [('folder', 'pred 1')])
+        self.assertEqual(self.runs, [1])
+
+    def test_same_thread_queued(self):
+        self._call_while_polling(lambda: self._process(2))
+
+        self.assertEqual(self._process(1), ('folder', 'pred 1'))
+        self.assertEqual(self.nested, [('folder', 'pred 2')])
+        self.assertEqual(self.runs, [1, 2])
+
+    def test_same_thread_superseded(self):
+        self._call_while_polling(
+            lambda: self._process(2, 'widget'),
+            lambda: self._process(3, 'widget'),
+        )
+
+        self.assertEqual(self._process(1, 'widget'), ('folder', 'pred 1'))
+        self.assertEqual(self.nested, [('folder', 'pred 3'), (None, None)])
+        self.assertEqual(self.runs, [1, 3])
+
+    def test_cross_thread(self):
+        results = [None] * 3
+
+        def _run(ix):
+            results[ix] = self._process(1)
+
+        threads = [threading.Thread(target=_run, args=(i,)) for i in (0, 1)]
+        for thread in threads:
+            thread.start()
+
+        _run(2)  # main thread
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [('folder', 'pred 1')] * 3)
+        self.assertEqual(self.runs, [1])
+
+    def test_from_runner_thread(self):
+        """a request made while executing one is refused, not raised"""
+
+        process_once = self.logic._process_once
+
+        def _process_once(*args):
+            self.nested.append(self._process(2))
+            return process_once(*args)
+
+        self.logic._process_once = _process_once
+
+        self.assertEqual(self._process(1), ('folder', 'pred 1'))
+        self.assertEqual(self.nested, [(None, None)])
+        self.assertEqual(self.runs, [1])
+        self.assertTrue(any('cannot be made' in x for x in self.logs))
+
+    def test_live_output(self):
+        """output lines of a process run on a worker thread are logged
+        while it runs"""
+
+        process = create_sub_process(
+            sys.executable,
+            ['-c', "import time; print('started', flush=True); time.sleep(2)"],
+        )
+        waiter = threading.Thread(
+            target=self.logic._wait_process_or_except, args=(process, True)
+        )
+        waiter.start()
+
+        deadline = time.monotonic() + 1.5
+        while 'started' not in self.logs and time.monotonic() < deadline:
+            self.logic._poll_events()
+            time.sleep(0.05)
+
+        self.assertIn('started', self.logs)
+        self.assertIsNone(process.poll())  # still running
+        waiter.join()
+
+
+class RequestKeyTest(unittest.TestCase):
+    def test_arrays(self):
+        x = np.random.rand(64, 64, 64).astype(np.float32)
+
+        self.assertEqual(request_key(x, 1), request_key(x.copy(), 1))
+        self.assertNotEqual(request_key(x, 1), request_key(x, 2))
+        self.assertNotEqual(request_key(x), request_key(x + 1))
+        self.assertNotEqual(request_key(x), request_key(x.astype(np.float64)))
+        self.assertNotEqual(request_key(x), request_key(x.reshape(64, 32, 128)))
+        self.assertEqual(
+            request_key((x, None), [1.6, 5]), request_key((x, None), [1.6, 5])
+        )
+
+    def test_sampled(self):
+        """only a strided sample of the values is hashed"""
+
+        x = np.zeros((64, 64, 64), dtype=np.float32)
+        y = x.copy()
+        y[1, 1, 1] = 1  # between the samples
+
+        self.assertEqual(
+            request_key(x, n_samples=8**3), request_key(y, n_samples=8**3)
+        )
+        self.assertNotEqual(
+            request_key(x, n_samples=x.size), request_key(y, n_samples=x.size)
+        )
+
+
+class RequestCoalescerTest(unittest.TestCase):
+    def test_runner_thread(self):
+        coalescer = RequestCoalescer()
+
+        future, _ = coalescer.submit(
+            'a', lambda: coalescer.submit('b', lambda: None)
+        )
+        with self.assertRaises(RuntimeError):
+            future.result()
+
+    def test_supersede(self):
+        coalescer = RequestCoalescer()
+        started, release = threading.Event(), threading.Event()
+
+        def _run():
+            started.set()
+            return release.wait(5)
+
+        running, _ = coalescer.submit('a', _run, 'g')
+        started.wait(5)  # not superseded once started
+        queued, _ = coalescer.submit('b', lambda: 'b', 'g')
+        other, _ = coalescer.submit('c', lambda: 'c')
+        coalescer.supersede('g')
+        release.set()
+
+        self.assertTrue(running.result())
+        with self.assertRaises(RequestSupersededError):
+            queued.result()
+        self.assertEqual(other.result(), 'c')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from deedsBCVLib.distributed import DONE, Coordinator, Worker, _request
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _double(job_id, spec):
+    time.sleep(0.05)
+    return {'n': 2 * spec['n']}
+
+
+class DistributedTest(unittest.TestCase):
+    def setUp(self):
+        self.stop = threading.Event()
+        self.threads = []
+
+    def tearDown(self):
+        self.stop.set()
+        for thread in self.threads:
+            thread.join(5)
+
+    def _tmp_folder(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        return tmp.name
+
+    def _start_workers(self, address, run_job, n, token=None):
+        for i in range(n):
+            worker = Worker(
+                address,
+                run_job,
+                name=f'worker-{i}',
+                heartbeat_interval=0.1,
+                poll_interval=0.05,
+                retry_delay=0.05,
+                max_retry_delay=0.2,
+                token=token,
+            )
+            thread = threading.Thread(target=worker.run, args=(self.stop,))
+            thread.start()
+            self.threads.append(thread)
+
+    def test_workers_and_dead_worker(self):
+        coordinator = Coordinator(heartbeat_timeout=0.5).start()
+        self.addCleanup(coordinator.stop)
+        job_ids = [coordinator.submit({'n': n}) for n in range(12)]
+
+        # takes a job then never reports back (nor sends heartbeats)
+        dead = _request(coordinator.address, {'op': 'get', 'worker': 'dead'})
+        self.assertIsNotNone(dead['job'])
+
+        self._start_workers(coordinator.address, _double, 3)
+        states = coordinator.wait(job_ids, timeout=30)
+
+        for n, job_id in enumerate(job_ids):
+            self.assertEqual(states[job_id]['state'], DONE)
+            self.assertEqual(states[job_id]['result'], {'n': 2 * n})
+            self.assertNotEqual(states[job_id]['worker'], 'dead')
+
+        self.assertEqual(states[dead['job']['id']]['attempts'], 2)
+
+    def test_coordinator_started_late(self):
+        port = _free_port()
+        self._start_workers(('127.0.0.1', port), _double, 3)
+        time.sleep(0.3)  # workers are retrying
+
+        coordinator = Coordinator(port=port).start()
+        self.addCleanup(coordinator.stop)
+        job_ids = [coordinator.submit({'n': n}) for n in range(3)]
+
+        states = coordinator.wait(job_ids, timeout=30)
+        self.assertTrue(all(x['state'] == DONE for x in states.values()))
+
+    def test_result_sent_after_restart(self):
+        port = _free_port()
+        journal_path = os.path.join(self._tmp_folder(), 'jobs.json')
+
+        coordinator = Coordinator(port=port, journal_path=journal_path).start()
+        restarted = []
+
+        def _restart_coordinator(job_id, spec):
+            # the coordinator is down when the result is ready, then comes
+            # back (a new process) with the jobs of its journal
+            if not restarted:
+                coordinator.stop()
+
+                def _start_again():
+                    time.sleep(0.5)
+                    restarted.append(
+                        Coordinator(
+                            port=port, journal_path=journal_path
+                        ).start()
+                    )
+
+                threading.Thread(target=_start_again, daemon=True).start()
+
+            return {'n': spec['n']}
+
+        job_id = coordinator.submit({'n': 1})
+        self._start_workers(('127.0.0.1', port), _restart_coordinator, 1)
+
+        deadline = time.monotonic() + 30
+        while not restarted and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.addCleanup(restarted[0].stop)
+
+        states = restarted[0].wait([job_id], timeout=30)
+        self.assertEqual(states[job_id]['state'], DONE)
+        self.assertEqual(states[job_id]['result'], {'n': 1})
+        self.assertEqual(states[job_id]['attempts'], 1)  # not run again
+
+    def test_token(self):
+        coordinator = Coordinator(token='secret').start()
+        self.addCleanup(coordinator.stop)
+        job_id = coordinator.submit({'n': 3})
+
+        for token in (None, 'guess'):
+            response = _request(
+                coordinator.address, {'op': 'get', 'worker': 'other'}, token
+            )
+            self.assertEqual(response, {'error': 'Unauthorized'})
+
+        worker = Worker(coordinator.address, _double, token='guess')
+        with self.assertRaises(ValueError):
+            worker.run(self.stop)
+
+        self._start_workers(coordinator.address, _double, 1, token='secret')
+        states = coordinator.wait([job_id], timeout=30)
+        self.assertEqual(states[job_id]['result'], {'n': 6})
+
+
+if __name__ == '__main__':
+    unittest.main()
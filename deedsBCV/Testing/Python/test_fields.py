@@ -0,0 +1,101 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from deedsBCVLib import fields
+
+SHAPE = (12, 10, 8)  # (D, H, W) of the image
+GRID_STEP = 2
+
+
+def _smooth_field(grid, amplitude=0.5):
+    """small, smooth displacements on a control-point grid"""
+
+    z, y, x = np.indices(grid, dtype=np.float64) / np.reshape(
+        grid, (3, 1, 1, 1)
+    )
+    return amplitude * np.stack(
+        [np.sin(np.pi * y), np.cos(np.pi * x) * z, x * y]
+    ).astype(np.float32)
+
+
+class DisplacementsFileTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, 'pred_displacements.dat')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_round_trip(self):
+        grid = fields.grid_shape(SHAPE, GRID_STEP)
+        field = np.random.rand(3, *grid).astype(np.float32)
+        fields.write_displacements(field, self.path)
+
+        self.assertEqual(fields.infer_grid_step(self.path, SHAPE), GRID_STEP)
+        for grid_step in (GRID_STEP, None):
+            np.testing.assert_array_equal(
+                fields.read_displacements(self.path, SHAPE, grid_step), field
+            )
+
+    def test_deeds_layout(self):
+        """the file holds u, v, w: displacements along H, W and D"""
+
+        grid = fields.grid_shape(SHAPE, GRID_STEP)
+        u, v, w = (np.full(grid, c, dtype=np.float32) for c in (1, 2, 3))
+        np.stack([u, v, w]).tofile(self.path)
+
+        field = fields.read_displacements(self.path, SHAPE)
+
+        np.testing.assert_array_equal(field[:, 0, 0, 0], [3, 1, 2])
+
+    def test_wrong_shape(self):
+        np.zeros((3, 5, 5, 5), dtype=np.float32).tofile(self.path)
+
+        with self.assertRaises(ValueError):
+            fields.infer_grid_step(self.path, SHAPE)
+
+
+class InvertDisplacementsTest(unittest.TestCase):
+    def _residual(self, field, inverse, affine):
+        """|A p + field(p) - q|, with p = q + inverse(q), at the grid points"""
+
+        grid = field.shape[1:]
+        scale = (np.array(SHAPE) / np.array(grid)).reshape(3, 1)
+
+        q = np.indices(grid, dtype=np.float64).reshape(3, -1) * scale
+        p = q + inverse.reshape(3, -1)
+        u = fields.interpolate(field, p / scale).reshape(3, -1)
+        mapped = affine[:3, :3] @ p + affine[:3, 3:] + u
+
+        return np.abs(mapped - q)
+
+    def test_inverse(self):
+        field = _smooth_field(fields.grid_shape(SHAPE, GRID_STEP))
+
+        inverse = fields.invert_displacements(field, SHAPE, tol=1e-5)
+
+        self.assertEqual(inverse.shape, field.shape)
+        self.assertLess(self._residual(field, inverse, np.eye(4)).max(), 1e-3)
+
+    def test_inverse_with_affine(self):
+        field = _smooth_field(fields.grid_shape(SHAPE, GRID_STEP))
+        affine = np.eye(4)
+        affine[:3, :3] += 0.02 * np.array([[1, 0, 1], [0, -1, 0], [1, 0, 0]])
+        affine[:3, 3] = [0.5, -0.25, 0.1]
+
+        inverse = fields.invert_displacements(field, SHAPE, affine, tol=1e-5)
+
+        self.assertLess(self._residual(field, inverse, affine).max(), 1e-3)
+
+    def test_no_displacements(self):
+        field = np.zeros((3,) + fields.grid_shape(SHAPE, GRID_STEP))
+
+        inverse = fields.invert_displacements(field, SHAPE)
+
+        np.testing.assert_array_equal(inverse, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
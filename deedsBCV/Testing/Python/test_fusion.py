@@ -0,0 +1,81 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+from deedsBCVLib.fusion import fuse_labels
+
+SHAPE = (4, 3, 5)
+
+
+class FuseLabelsTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.folder = Path(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _save(self, name, x):
+        path = self.folder / f'{name}.nii.gz'
+        nib.save(nib.Nifti1Image(x, np.eye(4)), str(path))
+        return path
+
+    def _fuse(self, segs, **kwargs):
+        paths = [self._save(f'seg_{i}', y) for i, y in enumerate(segs)]
+        out_path = fuse_labels(
+            paths,
+            self.folder / 'fused.nii.gz',
+            labels=np.unique(np.concatenate([np.unique(y) for y in segs])),
+            slab_size=2,  # `SHAPE` depth is not a multiple of it
+            **kwargs,
+        )
+        return np.asarray(nib.load(str(out_path)).dataobj)
+
+    def test_majority(self):
+        segs = [np.full(SHAPE, v, dtype=np.int16) for v in (1, 2, 2)]
+        segs[0][..., 4] = 3  # one vote only: the majority still wins
+        segs[1][..., 1] = 1  # 1 has the majority on this slice
+
+        fused = self._fuse(segs)
+
+        self.assertEqual(fused.dtype, np.int16)
+        self.assertEqual(fused.shape, SHAPE)
+        np.testing.assert_array_equal(fused[..., 1], 1)
+        np.testing.assert_array_equal(np.delete(fused, 1, axis=-1), 2)
+
+    def test_majority_weights(self):
+        segs = [np.full(SHAPE, v, dtype=np.int16) for v in (1, 2, 2)]
+
+        fused = self._fuse(segs, weights=np.array([3.0, 1.0, 1.0]))
+
+        np.testing.assert_array_equal(fused, 1)
+
+    def test_weighted(self):
+        """the atlas whose warped image looks like the fixed one wins"""
+
+        segs = [np.full(SHAPE, v, dtype=np.int16) for v in (1, 2, 2)]
+        fixed = np.random.rand(*SHAPE).astype(np.float32)
+        deformed = [fixed, fixed + 5.0, fixed - 5.0]
+        deformed[1][..., :2] = fixed[..., :2]  # atlas 1 matches there too
+
+        fused = self._fuse(
+            segs,
+            method='weighted',
+            fixed_path=self._save('fixed', fixed),
+            deformed_paths=[
+                self._save(f'deformed_{i}', x) for i, x in enumerate(deformed)
+            ],
+        )
+
+        np.testing.assert_array_equal(fused[..., :2], 2)
+        np.testing.assert_array_equal(fused[..., 2:], 1)
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            self._fuse([np.zeros(SHAPE, dtype=np.int16)], method='staple')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+from deedsBCVLib import fields, store
+
+SHAPE = (36, 24, 16)  # (D, H, W) of the fixed image
+GRID_STEP = 4
+CHUNK_DEPTH = 4
+
+
+class CompactTransformTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.folder = Path(self._tmp.name)
+        self.out_folder = self.folder / 'out'
+        self.out_folder.mkdir()
+
+        # displacements of very different magnitude from a chunk to another
+        grid = fields.grid_shape(SHAPE, GRID_STEP)
+        rng = np.random.default_rng(0)
+        self.field = rng.normal(size=(3,) + grid).astype(np.float32)
+        self.field *= np.logspace(-3, 2, grid[0])[None, :, None, None]
+
+        self.displacements_path = str(self.folder / 'pred_displacements.dat')
+        fields.write_displacements(self.field, self.displacements_path)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _save(self, **kwargs):
+        return store.save_compact_transform(
+            self.out_folder,
+            self.displacements_path,
+            SHAPE,
+            chunk_depth=CHUNK_DEPTH,
+            **kwargs,
+        )
+
+    def test_quantization_error(self):
+        """at most half a quantization step, each chunk with its own one"""
+
+        self._save()
+        loaded = store.load_displacements(self.out_folder)
+
+        self.assertEqual(loaded.shape, self.field.shape)
+        for k0 in range(0, self.field.shape[1], CHUNK_DEPTH):
+            chunk = self.field[:, k0 : k0 + CHUNK_DEPTH]
+            step = np.abs(chunk).max() / np.iinfo(np.int16).max
+
+            error = np.abs(loaded[:, k0 : k0 + CHUNK_DEPTH] - chunk).max()
+            self.assertLessEqual(error, step / 2 * (1 + 1e-3))
+
+    def test_metadata(self):
+        self._save(metadata={'params': [1.6, 5, 8, 8, 5]})
+        metadata = store.load_metadata(self.out_folder)
+
+        self.assertEqual(metadata['shape'], list(SHAPE))
+        self.assertEqual(metadata['grid_step'], GRID_STEP)
+        self.assertEqual(metadata['params'], [1.6, 5, 8, 8, 5])
+        self.assertFalse(metadata['inverse'])
+
+    def test_inverse(self):
+        inverse_path = str(self.folder / 'pred_inverse_displacements.dat')
+        fields.write_displacements(-self.field, inverse_path)
+
+        self._save(inverse_displacements_path=inverse_path)
+
+        np.testing.assert_allclose(
+            store.load_displacements(self.out_folder, inverse=True),
+            -store.load_displacements(self.out_folder),
+        )
+
+    def test_no_inverse(self):
+        self._save(inverse_displacements_path=self.folder / 'missing.dat')
+
+        with self.assertRaises(ValueError):
+            store.load_displacements(self.out_folder, inverse=True)
+
+    def test_affine(self):
+        affine_path = self.folder / 'my_affine.txt'
+        np.savetxt(affine_path, np.eye(4))
+
+        self._save(affine_path=affine_path)
+
+        self.assertEqual(
+            store.affine_path_or_none(self.out_folder),
+            str(self.out_folder / store.AFFINE_FILENAME),
+        )
+        with self.assertRaises(ValueError):
+            self._save(affine_path=self.folder / 'missing.txt')
+
+    def test_no_affine(self):
+        self._save()
+
+        self.assertIsNone(store.affine_path_or_none(self.out_folder))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+
+import numpy as np
+from deedsBCVLib import tiling
+
+
+class TileRangesTest(unittest.TestCase):
+    def test_cover(self):
+        for depth, tile_depth, overlap in (
+            (72, 24, 8),
+            (70, 24, 8),
+            (64, 32, 0),
+            (100, 40, 12),
+        ):
+            ranges = tiling.tile_ranges(depth, tile_depth, overlap)
+
+            self.assertEqual(ranges[0][0], 0)
+            self.assertEqual(ranges[-1][1], depth)
+            for z0, z1 in ranges:
+                self.assertEqual(z1 - z0, tile_depth)
+            for (_, z1), (z0, _) in zip(ranges, ranges[1:]):
+                self.assertGreaterEqual(z1 - z0, overlap)  # no gap either
+
+    def test_last_tile_moved_back(self):
+        self.assertEqual(
+            tiling.tile_ranges(70, 24, 8),
+            [(0, 24), (16, 40), (32, 56), (46, 70)],
+        )
+
+    def test_one_tile(self):
+        self.assertEqual(tiling.tile_ranges(20, 24, 8), [(0, 20)])
+
+    def test_overlap_too_large(self):
+        with self.assertRaises(ValueError):
+            tiling.tile_ranges(72, 8, 8)
+
+
+class BlendFieldsTest(unittest.TestCase):
+    DEPTH, GRID_STEP, OVERLAP = 96, 4, 16
+
+    def _blend(self, value):
+        """blends tiles of constant fields `value(ix)`"""
+
+        ranges = tiling.tile_ranges(self.DEPTH, 32, self.OVERLAP)
+        tile_fields = [
+            np.full(
+                (3, (z1 - z0) // self.GRID_STEP, 5, 6),
+                value(ix),
+                dtype=np.float32,
+            )
+            for ix, (z0, z1) in enumerate(ranges)
+        ]
+        blended = tiling.blend_fields(
+            tile_fields, ranges, self.DEPTH, self.GRID_STEP, self.OVERLAP
+        )
+
+        self.assertEqual(blended.shape, (3, self.DEPTH // self.GRID_STEP, 5, 6))
+        return blended
+
+    def test_constant(self):
+        np.testing.assert_allclose(self._blend(lambda ix: 1.5), 1.5, rtol=1e-6)
+
+    def test_continuity(self):
+        """the blend ramps from a tile to the next one across the overlap,
+        without jumps"""
+
+        profile = self._blend(float)[0, :, 0, 0]  # tile ix has value ix
+
+        steps = np.diff(profile)
+        self.assertTrue((steps >= 0).all())
+        self.assertLessEqual(steps.max(), self.GRID_STEP / self.OVERLAP + 1e-6)
+        self.assertEqual(profile[0], 0)  # no ramp at the volume ends
+        self.assertEqual(profile[-1], len(tiling.tile_ranges(96, 32, 16)) - 1)
+
+    def test_weights(self):
+        weights = tiling.blend_weights(12, 4)
+
+        np.testing.assert_allclose(weights, weights[::-1])
+        np.testing.assert_allclose(weights[:4], [0.125, 0.375, 0.625, 0.875])
+        np.testing.assert_array_equal(weights[4:8], 1)
+        np.testing.assert_array_equal(
+            tiling.blend_weights(12, 4, ramp_start=False)[:8], 1
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
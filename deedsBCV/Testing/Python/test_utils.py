@@ -0,0 +1,100 @@
+import unittest
+
+import numpy as np
+from deedsBCVLib.utils import (
+    common_shape,
+    fit_to_shape,
+    reconcile_shapes,
+    shift_header,
+)
+
+
+def _world(header, index):
+    """world coordinates of voxel `index` (D, H, W ordering)"""
+
+    return (header @ np.array([*reversed(index), 1.0]))[:3]
+
+
+class FitToShapeTest(unittest.TestCase):
+    def setUp(self):
+        self.x = np.arange(5 * 8 * 3, dtype=np.float32).reshape(5, 8, 3) + 1
+
+    def test_pad_and_crop(self):
+        y, offset = fit_to_shape(self.x, (7, 6, 3), value=0)
+
+        self.assertEqual(y.shape, (7, 6, 3))
+        self.assertEqual(offset, (1, -1, 0))
+        np.testing.assert_array_equal(y[1:6], self.x[:, 1:7])
+        self.assertFalse(y[0].any() or y[6].any())
+
+    def test_offset(self):
+        y, offset = fit_to_shape(self.x, (7, 6, 3), value=0, offset=(2, -2, 0))
+
+        self.assertEqual(offset, (2, -2, 0))
+        np.testing.assert_array_equal(y[2:7], self.x[:, 2:8])
+        self.assertFalse(y[:2].any())
+
+    def test_same_shape(self):
+        y, offset = fit_to_shape(self.x, self.x.shape)
+
+        self.assertIs(y.base, self.x)
+        self.assertEqual(offset, (0, 0, 0))
+
+    def test_min_value(self):
+        y, _ = fit_to_shape(self.x, (7, 8, 3))
+
+        self.assertEqual(y[0].min(), self.x.min())
+
+
+class ReconcileShapesTest(unittest.TestCase):
+    def test_modes(self):
+        fixed = np.ones((5, 8, 3))
+        moving = np.ones((7, 6, 3))
+
+        for mode, shape in (('pad', (7, 8, 3)), ('crop', (5, 6, 3))):
+            f, m, reconciliation = reconcile_shapes(fixed, moving, mode)
+
+            self.assertEqual(f.shape, shape)
+            self.assertEqual(m.shape, shape)
+            self.assertEqual(reconciliation['shape'], list(shape))
+
+        self.assertEqual(reconciliation['fixed_offset'], [0, -1, 0])
+        self.assertEqual(reconciliation['moving_offset'], [-1, 0, 0])
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            common_shape([(1, 2, 3)], 'stretch')
+
+    def test_offsets_round_trip(self):
+        """a voxel keeps its world position in the reconciled volumes"""
+
+        header = np.diag([0.5, 2.0, 1.5, 1.0])
+        header[:3, 3] = [10.0, -3.0, 7.0]
+
+        fixed = np.random.rand(5, 8, 3)
+        moving = np.random.rand(7, 6, 4)
+        for mode in ('pad', 'crop'):
+            f, m, reconciliation = reconcile_shapes(fixed, moving, mode)
+
+            for x, y, offset in (
+                (fixed, f, reconciliation['fixed_offset']),
+                (moving, m, reconciliation['moving_offset']),
+            ):
+                shifted = shift_header(header, offset)
+                for index in np.ndindex(*x.shape):
+                    new_index = tuple(i + o for i, o in zip(index, offset))
+                    if not all(0 <= i < s for i, s in zip(new_index, y.shape)):
+                        continue  # cropped
+
+                    self.assertEqual(y[new_index], x[index])
+                    np.testing.assert_allclose(
+                        _world(shifted, new_index), _world(header, index)
+                    )
+
+    def test_shift_header_identity(self):
+        shifted = shift_header(None, (1, -2, 3))
+        np.testing.assert_allclose(_world(shifted, (1, -2, 3)), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+"""Many-to-one registration: atlases (images and their labels) registered to
+one fixed image, their warped labels fused (see `fusion`)."""
+
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from deedsBCVLib.fusion import fuse_labels
+from deedsBCVLib.utils import (
+    common_shape,
+    fit_to_shape,
+    np2nifty,
+    shift_header,
+)
+
+
+class AtlasRegistrationMixin:
+    """atlas registration mode of `deedsBCVLogic`"""
+
+    LABELS_FILENAME = 'labels'
+    ATLAS_FOLDER = 'atlas_{:03d}'
+    FUSED_FILENAME = 'fused_labels'
+
+    def process_atlases(
+        self,
+        fixed: tuple[np.array, None],  # todo header]
+        atlases: list[tuple[np.array, np.array]],  # (image, labels)
+        alsoAffineStep: bool = True,
+        advancedParams: tuple[float] = (1.60, 5, 8, 8, 5),
+        fusionMethod: str = 'majority',
+        atlasWeights: list[float] | None = None,
+        maxConcurrentJobs: int = 2,
+        output_folder=None,
+        deleteTemporaryFiles: bool = False,
+    ):
+        """
+        Many-to-one registration: the fixed image is staged once, atlases are
+        registered concurrently to it, then their warped labels are fused.
+        """
+
+        def _run(tempDir):
+            fused_path = self._process_atlases_or_except(
+                tempDir,
+                fixed,
+                atlases,
+                alsoAffineStep,
+                advancedParams,
+                fusionMethod,
+                atlasWeights,
+                maxConcurrentJobs,
+            )
+
+            if output_folder is not None:  # this folder is already existing
+                shutil.copy(fused_path, Path(output_folder))
+            return fused_path
+
+        return self._run_mode('Atlas registration', _run, deleteTemporaryFiles)
+
+    def _process_atlases_or_except(
+        self,
+        tempDir,
+        fixed,
+        atlases,
+        alsoAffineStep,
+        advancedParams,
+        fusionMethod,
+        atlasWeights,
+        maxConcurrentJobs,
+    ):
+        self.add_log('Pre-processing...')
+
+        # all the inputs are brought to one shape, as in `_reconcile_inputs`
+        fixed_arr, fixed_header = fixed
+        shape = common_shape(
+            [fixed_arr.shape] + [x.shape for x, _ in atlases],
+            self.shapeReconciliationMode,
+        )
+        fixed_arr, fixed_offset = fit_to_shape(fixed_arr, shape)
+
+        fixed_path = os.path.join(tempDir, f'{self.FIXED_FILENAME}.nii.gz')
+        np2nifty(
+            fixed_arr, fixed_path, shift_header(fixed_header, fixed_offset)
+        )
+
+        atlas_folders = []
+        for i, (atlas_arr, labels_arr) in enumerate(atlases):
+            assert labels_arr.shape == atlas_arr.shape
+
+            atlas_folder = Path(tempDir, self.ATLAS_FOLDER.format(i))
+            atlas_folder.mkdir(parents=True, exist_ok=True)
+            atlas_folders.append(atlas_folder)
+
+            atlas_arr, offset = fit_to_shape(atlas_arr, shape)
+            labels_arr, _ = fit_to_shape(labels_arr, shape, value=0)
+            self._save_reconciliation(
+                atlas_folder,
+                {
+                    'shape': list(shape),
+                    'fixed_offset': list(fixed_offset),
+                    'moving_offset': list(offset),
+                },
+            )
+
+            atlas_header = shift_header(fixed_header, offset)
+            np2nifty(
+                atlas_arr,
+                str(atlas_folder / f'{self.MOVING_FILENAME}.nii.gz'),
+                atlas_header,
+            )
+            np2nifty(
+                labels_arr,
+                str(atlas_folder / f'{self.LABELS_FILENAME}.nii.gz'),
+                atlas_header,
+            )
+
+        with (
+            self.profiler.stage('register_atlases', n_atlases=len(atlases)),
+            ThreadPoolExecutor(max_workers=maxConcurrentJobs) as executor,
+        ):
+            futures = [
+                executor.submit(
+                    self._register_atlas,
+                    fixed_path,
+                    atlas_folder,
+                    alsoAffineStep,
+                    advancedParams,
+                )
+                for atlas_folder in atlas_folders
+            ]
+            warped = self._wait_jobs(futures)
+
+        self.add_log(f'Fusing {len(warped)} atlases ({fusionMethod})...')
+        out_folder = Path(tempDir, self.OUTPUT_FOLDER)
+        out_folder.mkdir(parents=True, exist_ok=True)
+
+        with self.profiler.stage('fuse_labels', method=fusionMethod):
+            fused_path = fuse_labels(
+                [seg_path for _, seg_path in warped],
+                out_folder / f'{self.FUSED_FILENAME}.nii.gz',
+                labels=np.unique(
+                    np.concatenate([np.unique(y) for _, y in atlases])
+                ),
+                method=fusionMethod,
+                weights=atlasWeights,
+                fixed_path=fixed_path,
+                deformed_paths=[pred_path for pred_path, _ in warped],
+                sigma=float(fixed_arr[::4, ::4, ::4].std()) or 1.0,
+            )
+
+        self.add_log('Done :)')
+        return str(fused_path)
+
+    def _register_atlas(
+        self, fixed_path, atlas_folder, alsoAffineStep, advancedParams
+    ):
+        """runs in a worker thread, returns (deformed, deformed labels) paths"""
+
+        self.add_log(f'Registering {atlas_folder.name}...')
+        _, pred_path = self._register_in_thread_or_except(
+            str(atlas_folder / f'{self.MOVING_FILENAME}.nii.gz'),
+            fixed_path,
+            atlas_folder / self.OUTPUT_FOLDER,
+            alsoAffineStep,
+            advancedParams,
+            segmentation_path=str(
+                atlas_folder / f'{self.LABELS_FILENAME}.nii.gz'
+            ),
+        )
+
+        pred_stem = pred_path[: -len('_deformed.nii.gz')]
+        return pred_path, pred_stem + '_deformed_seg.nii.gz'
@@ -0,0 +1,222 @@
+"""Registration backends: builds of the deeds executables, one folder each.
+
+Each backend declares its capabilities (e.g 'linear', 'deformable', 'apply')
+and a cost model, `overhead + cost * n_voxels` seconds, used to pick one per
+job. A folder of executables can describe itself with a `backend.json`, e.g
+for a build compiled with AVX2 and OpenMP:
+
+    {"name": "deeds-avx2-omp", "capabilities": ["avx2", "openmp"],
+     "cost": 2e-7, "overhead": 1.0}
+
+Folders are discovered from `DEEDSBCV_BIN_DIR` (os.pathsep-separated), the
+bundled builds (`bundled/libs` and its sub-folders), the build tree, the
+installed extension and the PATH; the ones with an invalid description are
+skipped (and logged). Costs are estimates until `benchmark_backends`
+measures them (see `deedsBCVLogic.benchmark_backends`).
+"""
+
+import json
+import logging
+import os
+import platform
+import shutil
+import time
+
+ENV_BIN_DIR = 'DEEDSBCV_BIN_DIR'
+DESCRIPTION_FILENAME = 'backend.json'
+
+# relative to the folder of the scripts (deedsBCVLib)
+BUNDLED_DIR = '../../bundled/libs'
+BUILD_BIN_DIR = '../../build/bin'
+INSTALLED_BIN_DIR = '../..'  # Slicer_INSTALL_THIRDPARTY_LIB_DIR
+
+_EXECUTABLE_EXT = '.exe' if platform.system() == 'Windows' else ''
+_EXECUTABLES = {'linear': 'linear', 'deformable': 'deeds', 'apply': 'applyBCV'}
+_DESCRIPTION_TYPES = {
+    'name': str,
+    'capabilities': list,
+    'cost': (int, float),
+    'overhead': (int, float),
+}
+
+
+class Backend:
+    name = None
+
+    def __init__(self, capabilities=(), cost=1e-6, overhead=0.0):
+        self.capabilities = frozenset(capabilities)
+        self.cost = cost  # seconds per voxel
+        self.overhead = overhead  # seconds per job
+
+    def is_available(self):
+        return True
+
+    def estimate_cost(self, n_voxels):
+        return self.overhead + self.cost * n_voxels
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.name!r})'
+
+
+class ExecutableBackend(Backend):
+    def __init__(
+        self, bin_dir, name=None, capabilities=(), cost=1e-6, overhead=1.0
+    ):
+        """`overhead` accounts for staging inputs on disk and spawning"""
+
+        self.binDir = os.path.abspath(bin_dir)
+        self.name = name or self.binDir
+
+        found = {
+            capability
+            for capability, exe in _EXECUTABLES.items()
+            if os.path.isfile(self._path(exe))
+        }
+        super().__init__(found | set(capabilities), cost, overhead)
+
+    @classmethod
+    def from_folder(cls, bin_dir):
+        """reads the optional `backend.json` description of `bin_dir`,
+        raises ValueError if it is not a valid one"""
+
+        description = {}
+        description_path = os.path.join(bin_dir, DESCRIPTION_FILENAME)
+        if os.path.isfile(description_path):
+            try:
+                with open(description_path) as fp:
+                    description = json.load(fp)
+            except (OSError, ValueError) as e:  # incl. JSONDecodeError
+                raise ValueError(
+                    f'Cannot read {description_path}: {str(e)}'
+                ) from e
+
+            _check_description(description, description_path)
+
+        return cls(bin_dir, **description)
+
+    def _path(self, exe):
+        return os.path.join(self.binDir, exe + _EXECUTABLE_EXT)
+
+    def is_available(self):
+        return 'linear' in self.capabilities
+
+
+def _check_description(description, path):
+    if not isinstance(description, dict):
+        raise ValueError(f'{path} is not a JSON object')
+
+    for key, value in description.items():
+        if key not in _DESCRIPTION_TYPES:
+            raise ValueError(f'Unknown key {key} in {path}')
+
+        # bool is an int, but not a cost
+        if isinstance(value, bool) or not isinstance(
+            value, _DESCRIPTION_TYPES[key]
+        ):
+            raise ValueError(f'Invalid {key} in {path}: {value!r}')
+
+    if not all(isinstance(x, str) for x in description.get('capabilities', [])):
+        raise ValueError(f'Invalid capabilities in {path}')
+
+    if any(description.get(x, 0) < 0 for x in ('cost', 'overhead')):
+        raise ValueError(f'Negative cost in {path}')
+
+
+class BackendRegistry:
+    def __init__(self):
+        self._backends = {}  # name -> backend
+
+    def register(self, backend):
+        self._backends[backend.name] = backend
+        return backend
+
+    def discover(self, script_path):
+        """registers the executables found (in order of precedence) in
+        `DEEDSBCV_BIN_DIR`, the bundled builds, the build tree, the installed
+        extension and the PATH"""
+
+        candidates = [
+            x for x in os.environ.get(ENV_BIN_DIR, '').split(os.pathsep) if x
+        ]
+
+        bundled_dir = os.path.join(script_path, BUNDLED_DIR)
+        if os.path.isdir(bundled_dir):  # one build per sub-folder, or flat
+            candidates.append(bundled_dir)
+            candidates += sorted(
+                x.path for x in os.scandir(bundled_dir) if x.is_dir()
+            )
+
+        candidates.append(os.path.join(script_path, BUILD_BIN_DIR))
+        candidates.append(os.path.join(script_path, INSTALLED_BIN_DIR))
+
+        installed = shutil.which('deeds')
+        if installed is not None:
+            candidates.append(os.path.dirname(installed))
+
+        seen = {os.path.realpath(x.binDir) for x in self.executables()}
+        for candidate in candidates:
+            if os.path.realpath(candidate) in seen:
+                continue
+
+            try:
+                backend = ExecutableBackend.from_folder(candidate)
+            except ValueError as e:
+                logging.warning(f'Skipping backend {candidate}: {str(e)}')
+                continue
+
+            if backend.is_available() and backend.name not in self._backends:
+                self.register(backend)
+                seen.add(os.path.realpath(candidate))
+
+        return self
+
+    def get(self, name):
+        if name not in self._backends:
+            raise ValueError(f'Unknown backend {name}')
+
+        return self._backends[name]
+
+    def available(self):
+        return [x for x in self._backends.values() if x.is_available()]
+
+    def executables(self):
+        return [
+            x
+            for x in self._backends.values()
+            if isinstance(x, ExecutableBackend)
+        ]
+
+    def select(self, required=(), n_voxels=0, exclude=()):
+        """the available backend with all the `required` capabilities and
+        the lowest estimated cost"""
+
+        candidates = [
+            x
+            for x in self.available()
+            if x.capabilities >= set(required) and x.name not in exclude
+        ]
+        if not candidates:
+            raise ValueError(
+                f'No backend found with {", ".join(sorted(required))}'
+            )
+
+        # ties go to the first registered, i.e the higher precedence
+        return min(candidates, key=lambda x: x.estimate_cost(n_voxels))
+
+
+def benchmark_backends(backends, run_job, n_voxels, repeats=1):
+    """times `run_job(backend)` (best of `repeats`) for each backend and
+    updates its `cost` accordingly; returns {name: seconds}"""
+
+    timings = {}
+    for backend in backends:
+        best = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            run_job(backend)
+            best = min(best, time.perf_counter() - start)
+
+        timings[backend.name] = best
+        backend.cost = max(best - backend.overhead, 0.0) / n_voxels
+
+    return timings
@@ -0,0 +1,120 @@
+"""Batch registration: many (fixed, moving) pairs through a `StagedPipeline`,
+so that staging and loading back overlap with the deeds runs."""
+
+import shutil
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+
+from deedsBCVLib.pipeline import StagedPipeline
+from deedsBCVLib.utils import create_tmp_folder
+
+
+class BatchRegistrationMixin:
+    """batch registration mode of `deedsBCVLogic`"""
+
+    def process_batch(
+        self,
+        jobs: list[tuple[tuple[np.array, None], tuple[np.array, None]]],
+        alsoAffineStep: bool = True,
+        advancedParams: tuple[float] = (1.60, 5, 8, 8, 5),
+        output_folders=None,
+        onResult=None,
+        queueSize: int = 1,
+        deleteTemporaryFiles: bool = False,
+    ):
+        """
+        Register many (fixed, moving) pairs, overlapping the pre-processing of
+        the next job and the post-processing of the previous one with the
+        deeds run of the current one.
+        `onResult(index, pred_path, deformed_arr)` is called (from a worker
+        thread, so not touching the scene) as soon as a job is loaded back.
+        Returns the (tempDir, pred_path) of each job, pred_path None if failed.
+        """
+
+        batchDir = Path(create_tmp_folder())
+        if output_folders is None:
+            output_folders = [None] * len(jobs)
+
+        def _pre_process_job(ix):
+            tempDir = batchDir / f'job_{ix:03d}'
+            tempDir.mkdir(parents=True, exist_ok=True)
+            fixed, moving = jobs[ix]
+            return ix, tempDir, self._pre_process(str(tempDir), fixed, moving)
+
+        def _register_job(staged):
+            ix, tempDir, (fixed_path, moving_path) = staged
+            self.add_log(f'Registering job {ix}...')
+            affine_path, pred_path = self._register_in_thread_or_except(
+                moving_path,
+                fixed_path,
+                tempDir / self.OUTPUT_FOLDER,
+                alsoAffineStep,
+                advancedParams,
+            )
+            return ix, tempDir, affine_path, pred_path
+
+        def _post_process_job(registered):
+            ix, tempDir, affine_path, pred_path = registered
+            if onResult is not None:
+                deformed = nib.load(pred_path).get_fdata(dtype=np.float32)
+                onResult(ix, pred_path, deformed.swapaxes(0, 2))
+
+            if output_folders[ix] is not None:
+                self.save_to_output_folder(
+                    tempDir,
+                    Path(output_folders[ix]),
+                    advancedParams,
+                    affine_path,
+                )
+
+            if deleteTemporaryFiles:
+                shutil.rmtree(tempDir)
+
+            return str(tempDir), pred_path
+
+        pipeline = StagedPipeline(
+            [
+                ('pre_process', _pre_process_job),
+                ('register', _register_job),
+                ('post_process', _post_process_job),
+            ],
+            queue_size=queueSize,
+            profiler=self.profiler,
+        )
+
+        def _run(batchDir):
+            futures = pipeline.submit(range(len(jobs)))
+            try:
+                return self._wait_jobs(futures, stopOnError=False)
+            finally:
+                # after a cancel (or an error) the jobs left are dropped, but
+                # the stages must end before `cancelRequested` is reset
+                if [f for f in futures if f.cancel()]:
+                    self.cancelRequested = True
+                self._join_pipeline(pipeline)
+
+        _, results = self._run_mode(
+            'Batch registration', _run, tempDir=batchDir
+        )
+        if results is None:
+            results = [None] * len(jobs)
+
+        return [
+            (str(batchDir / f'job_{ix:03d}'), None)
+            if result is None
+            else result
+            for ix, result in enumerate(results)
+        ]
+
+    def _join_pipeline(self, pipeline):
+        """waits for the stages of `pipeline`, killing the processes they
+        start if cancelled"""
+
+        while not pipeline.join(timeout=0.1):
+            if self.cancelRequested:
+                self._kill_live_processes()
+            self._flush_pending_logs()
+
+        self._flush_pending_logs()
@@ -0,0 +1,107 @@
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def request_key(*parts, n_samples=2**16):
+    """digest of the request content. Arrays are hashed by shape, dtype and
+    a strided sample of about `n_samples` values, not whole volumes (this is
+    called on the GUI thread): arrays equal on the sample are the same."""
+
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            stride = max(1, round((part.size / n_samples) ** (1 / part.ndim)))
+            sample = part[(slice(None, None, stride),) * part.ndim]
+
+            digest.update(f'{part.shape}{part.dtype}{stride}'.encode())
+            digest.update(memoryview(np.ascontiguousarray(sample)).cast('B'))
+        elif isinstance(part, (tuple, list)):
+            digest.update(request_key(*part, n_samples=n_samples).encode())
+        else:
+            digest.update(repr(part).encode())
+
+    return digest.hexdigest()
+
+
+class RequestSupersededError(Exception):
+    pass
+
+
+class RequestCoalescer:
+    """Requests are queued and executed one at a time, in order, on a runner
+    thread. Identical requests (same key) pending share one execution, whose
+    result goes to all of their callers. A queued request is superseded if a
+    newer one of the same group arrives before it starts (e.g the user
+    changed parameters and pressed "Register!" again)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # key -> [future, group, generation]
+        self._generations = {}  # group -> last generation
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='deedsBCV-request'
+        )
+        self._runnerThread = None
+
+    def submit(self, key, function, group=None):
+        """queues `function()`, unless an identical request is pending.
+        Returns (future, False if it is the one of the pending request)"""
+
+        if threading.get_ident() == self._runnerThread:  # would deadlock
+            raise RuntimeError('Requests cannot be made while executing one')
+
+        with self._lock:
+            generation = self._next_generation(group)
+            if key in self._pending:  # now the newest of its group
+                pending = self._pending[key]
+                if pending[1] == group:
+                    pending[2] = generation
+
+                return pending[0], False
+
+            future = self._executor.submit(self._run, key, function)
+            self._pending[key] = [future, group, generation]
+            return future, True
+
+    def supersede(self, group):
+        """the queued requests of `group` won't be executed"""
+
+        with self._lock:
+            self._next_generation(group)
+
+    def _next_generation(self, group):
+        self._generations[group] = self._generations.get(group, 0) + 1
+        return self._generations[group]
+
+    def _run(self, key, function):
+        self._runnerThread = threading.get_ident()
+        try:
+            with self._lock:
+                _, group, generation = self._pending[key]
+                superseded = (
+                    group is not None and self._generations[group] > generation
+                )
+
+            if superseded:
+                raise RequestSupersededError(key)
+
+            return function()
+        finally:
+            with self._lock:  # later identical requests are new ones
+                del self._pending[key]
+
+
+def wait_future(future, poll=None):
+    while not future.done():
+        if poll is None:
+            return future.result()
+
+        poll()
+        time.sleep(0.05)
+
+    return future.result()
@@ -0,0 +1,382 @@
+"""Coordinator / worker execution of registrations across machines.
+
+The coordinator holds a job queue behind a TCP socket (newline-delimited
+JSON, one request per connection). Workers pull jobs, run them, send
+heartbeats while running and push back results. Jobs whose worker stops
+sending heartbeats, or that fail, are queued again (up to `max_retries`).
+Inputs and outputs are exchanged through a shared filesystem (see
+`deedsBCVLogic.stage_distributed_job` and `run_registration_job`).
+
+    coordinator = Coordinator(
+        host='0.0.0.0', port=5555, journal_path='jobs.json', token=secret
+    ).start()
+    job_id = coordinator.submit(logic.stage_distributed_job(...))
+
+    # on each node, within Slicer
+    run_job = partial(run_registration_job, logic)
+    Worker(('coordinator-host', 5555), run_job, token=secret).run()
+
+Job states are saved in `journal_path` (if given) and loaded back when the
+coordinator restarts; workers retry (with an exponential backoff) while it
+cannot be reached, so that a finished result is not lost meanwhile.
+
+Messages are neither encrypted nor signed: the `token` shared by the
+coordinator and the workers only keeps other clients out. Run it on a
+trusted network.
+"""
+
+import hmac
+import json
+import logging
+import os
+import shutil
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+
+def _request(address, message, token=None, timeout=30):
+    if token is not None:
+        message = {**message, 'token': token}
+
+    with socket.create_connection(address, timeout=timeout) as conn:
+        conn.sendall(json.dumps(message).encode() + b'\n')
+        with conn.makefile('rb') as fp:
+            return json.loads(fp.readline())
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        message = json.loads(self.rfile.readline())
+        try:
+            response = self.server.coordinator.handle(message)
+        except Exception as e:
+            response = {'error': str(e)}
+
+        self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class Coordinator:
+    def __init__(
+        self,
+        host='127.0.0.1',
+        port=0,
+        heartbeat_timeout=60.0,
+        max_retries=2,
+        journal_path=None,
+        token=None,
+    ):
+        self.heartbeatTimeout = heartbeat_timeout
+        self.maxRetries = max_retries
+        self.journalPath = journal_path
+        self.token = token
+
+        self.jobs = {}  # id -> state, spec, worker, attempts, result, error
+        self._queue = deque()
+        self._lock = threading.Condition()
+        if journal_path is not None and os.path.exists(journal_path):
+            self._load_journal()
+
+        self._server = _Server((host, port), _Handler)
+        self._server.coordinator = self
+        self._stopped = threading.Event()
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        threading.Thread(target=self._reap_dead_workers, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def submit(self, spec):
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self.jobs[job_id] = {
+                'state': QUEUED,
+                'spec': spec,
+                'worker': None,
+                'attempts': 0,
+                'result': None,
+                'error': None,
+            }
+            self._queue.append(job_id)
+            self._save_journal()
+
+        return job_id
+
+    def wait(self, job_ids, timeout=None):
+        """blocks until all jobs are done or failed, returns their states"""
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while any(
+                self.jobs[x]['state'] in (QUEUED, RUNNING) for x in job_ids
+            ):
+                remaining = (
+                    None if deadline is None else deadline - time.monotonic()
+                )
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError('Distributed jobs still running')
+
+                self._lock.wait(remaining)
+
+            return {x: dict(self.jobs[x]) for x in job_ids}
+
+    def handle(self, message):
+        if self.token is not None and not hmac.compare_digest(
+            str(message.get('token', '')).encode(), self.token.encode()
+        ):
+            return {'error': 'Unauthorized'}
+
+        op = message['op']
+        with self._lock:
+            if op == 'submit':
+                return {'id': self.submit(message['spec'])}
+
+            if op == 'get':
+                return {'job': self._assign(message['worker'])}
+
+            job = self.jobs.get(message['id'])
+            if job is None:
+                return {'error': f'Unknown job {message["id"]}'}
+
+            if op == 'status':
+                return {k: job[k] for k in ('state', 'result', 'error')}
+
+            # only the current owner can update a job (it may be reassigned)
+            if job['state'] != RUNNING or job['worker'] != message['worker']:
+                return {'ok': False}
+
+            if op == 'heartbeat':
+                job['lastHeartbeat'] = time.monotonic()
+            elif op == 'done':
+                job['state'], job['result'] = DONE, message['result']
+                self._save_journal()
+                self._lock.notify_all()
+            elif op == 'failed':
+                self._retry_or_fail(message['id'], message['error'])
+            else:
+                raise ValueError(f'Unknown operation {op}')
+
+            return {'ok': True}
+
+    def _assign(self, worker):
+        if not self._queue:
+            return None
+
+        job_id = self._queue.popleft()
+        job = self.jobs[job_id]
+        job.update(
+            {
+                'state': RUNNING,
+                'worker': worker,
+                'attempts': job['attempts'] + 1,
+                'lastHeartbeat': time.monotonic(),
+            }
+        )
+        self._save_journal()
+        return {'id': job_id, 'spec': job['spec']}
+
+    def _retry_or_fail(self, job_id, error):
+        job = self.jobs[job_id]
+        job['error'] = error
+
+        if job['attempts'] <= self.maxRetries:
+            logging.info(f'Retrying job {job_id}: {error}')
+            job['state'], job['worker'] = QUEUED, None
+            self._queue.append(job_id)
+        else:
+            job['state'] = FAILED
+            self._lock.notify_all()
+
+        self._save_journal()
+
+    def _save_journal(self):
+        """called with the lock held, on every change of a job state"""
+
+        if self.journalPath is None:
+            return
+
+        jobs = {
+            job_id: {k: v for k, v in job.items() if k != 'lastHeartbeat'}
+            for job_id, job in self.jobs.items()
+        }
+        tmp_path = f'{self.journalPath}.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump({'jobs': jobs, 'queue': list(self._queue)}, fp)
+        os.replace(tmp_path, self.journalPath)  # never half written
+
+    def _load_journal(self):
+        with open(self.journalPath) as fp:
+            journal = json.load(fp)
+
+        # running jobs keep their worker, which may still report back
+        now = time.monotonic()
+        self.jobs = {
+            job_id: {**job, 'lastHeartbeat': now}
+            if job['state'] == RUNNING
+            else job
+            for job_id, job in journal['jobs'].items()
+        }
+        self._queue = deque(journal['queue'])
+
+    def _reap_dead_workers(self):
+        while not self._stopped.wait(self.heartbeatTimeout / 4):
+            now = time.monotonic()
+            with self._lock:
+                for job_id, job in self.jobs.items():
+                    if (
+                        job['state'] == RUNNING
+                        and now - job['lastHeartbeat'] > self.heartbeatTimeout
+                    ):
+                        self._retry_or_fail(
+                            job_id, f'Worker {job["worker"]} is not responding'
+                        )
+
+
+class Worker:
+    def __init__(
+        self,
+        address,
+        run_job,
+        name=None,
+        heartbeat_interval=10.0,
+        poll_interval=2.0,
+        retry_delay=1.0,
+        max_retry_delay=30.0,
+        token=None,
+    ):
+        """`run_job(job_id, spec)` returns a (JSON-able) result, `token` is
+        the one of the coordinator"""
+
+        self.address = tuple(address)
+        self.runJob = run_job
+        self.name = name or f'{socket.gethostname()}-{uuid.uuid4().hex[:8]}'
+        self.heartbeatInterval = heartbeat_interval
+        self.pollInterval = poll_interval
+        self.retryDelay = retry_delay
+        self.maxRetryDelay = max_retry_delay
+        self.token = token
+
+    def run(self, stop_event=None, max_jobs=None):
+        """pulls and runs jobs until `stop_event` is set (or `max_jobs`)"""
+
+        stop_event = stop_event or threading.Event()
+        n_jobs = 0
+        while not stop_event.is_set() and (
+            max_jobs is None or n_jobs < max_jobs
+        ):
+            response = self._send(
+                {'op': 'get', 'worker': self.name}, stop_event
+            )
+            if response is None:  # stopped
+                break
+            if 'error' in response:  # e.g. a wrong token: retrying is vain
+                raise ValueError(f'Coordinator refused: {response["error"]}')
+
+            job = response['job']
+            if job is None:
+                stop_event.wait(self.pollInterval)
+                continue
+
+            self._run(job['id'], job['spec'], stop_event)
+            n_jobs += 1
+
+    def _send(self, message, stop_event):
+        """sends `message` until the coordinator answers (None if
+        `stop_event` is set first), waiting longer after each failure"""
+
+        delay = self.retryDelay
+        while True:
+            try:
+                return _request(self.address, message, self.token)
+            except (OSError, ValueError) as e:  # unreachable or cut off
+                logging.warning(
+                    f'{self.name}: coordinator not reachable ({str(e)}), '
+                    f'retrying in {delay:.0f}s'
+                )
+
+            if stop_event.wait(delay):
+                return None
+
+            delay = min(2 * delay, self.maxRetryDelay)
+
+    def _run(self, job_id, spec, stop_event):
+        finished = threading.Event()
+
+        def _send_heartbeats():
+            while not finished.wait(self.heartbeatInterval):
+                try:
+                    _request(
+                        self.address,
+                        {'op': 'heartbeat', 'worker': self.name, 'id': job_id},
+                        self.token,
+                    )
+                except OSError:  # coordinator busy or restarting
+                    pass
+
+        threading.Thread(target=_send_heartbeats, daemon=True).start()
+        try:
+            message = {'op': 'done', 'result': self.runJob(job_id, spec)}
+        except Exception as e:
+            message = {'op': 'failed', 'error': f'{self.name}: {str(e)}'}
+        finally:
+            finished.set()
+
+        message.update({'worker': self.name, 'id': job_id})
+        response = self._send(message, stop_event)
+        if response is None:
+            # the coordinator will queue the job again (no heartbeats)
+            logging.warning(f'{self.name}: result of job {job_id} not sent')
+        elif not response.get('ok', False):  # reassigned, or unknown job
+            logging.warning(
+                f'{self.name}: result of job {job_id} refused '
+                f'({response.get("error", "job reassigned")})'
+            )
+
+
+def run_registration_job(logic, job_id, spec):
+    """stages the shared inputs of `spec` locally, registers them and saves
+    the outputs in the shared `spec['result_dir']`/`job_id`"""
+
+    folder = Path(tempfile.mkdtemp(prefix='deedsBCV_'))
+    try:
+        for path in Path(spec['staged_dir']).iterdir():
+            shutil.copy(path, folder)
+
+        affine_path, _ = logic._register_in_thread_or_except(
+            str(folder / f'{logic.MOVING_FILENAME}.nii.gz'),
+            str(folder / f'{logic.FIXED_FILENAME}.nii.gz'),
+            folder / logic.OUTPUT_FOLDER,
+            spec['alsoAffineStep'],
+            tuple(spec['advancedParams']),
+        )
+
+        result_dir = Path(spec['result_dir']) / job_id
+        result_dir.mkdir(parents=True, exist_ok=True)
+        logic.save_to_output_folder(
+            folder, result_dir, tuple(spec['advancedParams']), affine_path
+        )
+    finally:
+        shutil.rmtree(folder)
+
+    return {'result_dir': str(result_dir)}
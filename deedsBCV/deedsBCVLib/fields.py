@@ -0,0 +1,107 @@
+"""Displacement fields as written by deeds in *_displacements.dat: float32,
+3 planar components (u, v, w) at control-point resolution, each laid out as
+deeds' volumes (first nifti axis fastest, i.e. C-ordered D, H, W in numpy).
+As in deeds' `warpAffine`, a voxel p of the fixed image is mapped to
+X p + (v, u, w)(p) in the moving one, with X the affine of *_matrix.txt and
+coordinates in (first, second, third) nifti axes order.
+
+Here fields are (3, D, H, W) arrays, components ordered as numpy axes.
+"""
+
+import os
+
+import numpy as np
+
+
+def grid_shape(shape, grid_step):
+    return tuple(s // grid_step for s in shape)
+
+
+def infer_grid_step(path, shape):
+    """deeds' control-point spacing, from the size of the .dat file"""
+
+    n_points = os.path.getsize(path) // (3 * 4)
+    for grid_step in range(1, max(shape) + 1):
+        if np.prod(grid_shape(shape, grid_step)) == n_points:
+            return grid_step
+
+    raise ValueError(f'{path} does not match a volume of shape {shape}')
+
+
+def read_displacements(path, shape, grid_step=None):
+    """`shape` is the (D, H, W) of the fixed image"""
+
+    if grid_step is None:
+        grid_step = infer_grid_step(path, shape)
+
+    u, v, w = np.fromfile(path, dtype=np.float32).reshape(
+        (3,) + grid_shape(shape, grid_step)
+    )
+    return np.stack([w, u, v])
+
+
+def write_displacements(field, path):
+    d, h, w = field
+    np.stack([h, w, d]).astype(np.float32).tofile(path)
+    return path
+
+
+def read_affine(path):
+    """4x4 affine of *_matrix.txt, acting on (D, H, W) coordinates"""
+
+    X = np.loadtxt(path, dtype=np.float64).reshape(4, 4)
+    if not np.allclose(X[3, :3], 0) and np.allclose(X[:3, 3], 0):
+        X = X.T  # stored column-major
+
+    axes = [2, 1, 0, 3]  # nifti axes -> numpy axes
+    return X[np.ix_(axes, axes)]
+
+
+def interpolate(field, coords):
+    """trilinear interpolation of a (C, D, H, W) field at `coords`, (3, ...)
+    in grid units; outside of the grid, values at the border are used"""
+
+    shape = np.array(field.shape[1:])
+    lower, weights = [], []
+    for axis in range(3):
+        x = np.clip(coords[axis], 0, shape[axis] - 1)
+        x0 = np.clip(np.floor(x).astype(np.intp), 0, max(shape[axis] - 2, 0))
+        lower.append(x0)
+        weights.append(x - x0)
+
+    out = np.zeros((field.shape[0],) + np.shape(coords[0]), dtype=field.dtype)
+    for corner in np.ndindex(2, 2, 2):
+        ixs, w = [], 1.0
+        for axis, offset in enumerate(corner):
+            ixs.append(np.minimum(lower[axis] + offset, shape[axis] - 1))
+            w = w * (weights[axis] if offset else 1 - weights[axis])
+
+        out += w * field[:, ixs[0], ixs[1], ixs[2]]
+
+    return out
+
+
+def invert_displacements(field, shape, affine=None, n_iter=50, tol=1e-3):
+    """Inverse of the transform p -> A p + field(p), as a displacement field
+    (no affine) on the same grid, via (vectorized) fixed-point iterations
+    p <- A^-1 (q - field(p)). `shape` is the (D, H, W) of the image."""
+
+    grid = field.shape[1:]
+    scale = np.array(shape, dtype=np.float64) / np.array(grid)
+    scale = scale.reshape(3, 1)
+
+    A = np.eye(4) if affine is None else np.asarray(affine, dtype=np.float64)
+    A_inv = np.linalg.inv(A)
+
+    q = np.indices(grid, dtype=np.float64).reshape(3, -1) * scale
+    p = A_inv[:3, :3] @ q + A_inv[:3, 3:]
+    for _ in range(n_iter):
+        u = interpolate(field, p / scale).reshape(3, -1)
+        p_next = A_inv[:3, :3] @ (q - u) + A_inv[:3, 3:]
+
+        converged = np.abs(p_next - p).max() < tol
+        p = p_next
+        if converged:
+            break
+
+    return (p - q).reshape((3,) + grid).astype(np.float32)
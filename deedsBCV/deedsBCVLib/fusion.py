@@ -0,0 +1,82 @@
+import nibabel as nib
+import numpy as np
+
+FUSION_METHODS = ('majority', 'weighted')
+
+
+def _load_lazily(path):
+    # keep the (gzip) stream open: slabs are read in order (forward seeks)
+    return nib.load(str(path), keep_file_open=True)
+
+
+def fuse_labels(
+    label_paths,
+    out_path,
+    labels,
+    method='majority',
+    weights=None,
+    fixed_path=None,
+    deformed_paths=None,
+    sigma=1.0,
+    slab_size=16,
+):
+    """Fuse warped atlas labels into one segmentation, slab by slab along
+    depth (last axis on disk), so that memory does not grow with the number
+    of atlases.
+
+    - majority: each atlas votes with its (global) weight
+    - weighted: votes are also weighted, voxel-wise, by the intensity
+      similarity between the fixed image and the warped atlas image
+    """
+
+    if method not in FUSION_METHODS:
+        raise ValueError(f'Unknown fusion method {method}')
+
+    if weights is None:
+        weights = np.ones(len(label_paths), dtype=np.float32)
+
+    label_imgs = [_load_lazily(p) for p in label_paths]
+    if method == 'weighted':
+        fixed_img = _load_lazily(fixed_path)
+        deformed_imgs = [_load_lazily(p) for p in deformed_paths]
+
+    reference = label_imgs[0]
+    shape = reference.shape
+    label_values = np.unique(np.asarray(labels))
+
+    fused = np.empty(shape, dtype=reference.get_data_dtype())
+    for z0 in range(0, shape[-1], slab_size):
+        z1 = min(z0 + slab_size, shape[-1])
+        n_voxels = int(np.prod(shape[:-1])) * (z1 - z0)
+
+        votes = np.zeros((len(label_values), n_voxels), dtype=np.float32)
+        voxels = np.arange(n_voxels)
+
+        if method == 'weighted':
+            fixed_slab = np.asarray(
+                fixed_img.dataobj[..., z0:z1], dtype=np.float32
+            ).ravel()
+
+        for i, label_img in enumerate(label_imgs):
+            seg = np.asarray(label_img.dataobj[..., z0:z1]).ravel()
+            label_ixs = np.searchsorted(label_values, seg)
+            label_ixs = np.clip(label_ixs, 0, len(label_values) - 1)
+
+            vote = weights[i]
+            if method == 'weighted':
+                deformed_slab = np.asarray(
+                    deformed_imgs[i].dataobj[..., z0:z1], dtype=np.float32
+                ).ravel()
+                vote = vote * np.exp(
+                    -np.square(fixed_slab - deformed_slab) / (2 * sigma**2)
+                )
+
+            votes[label_ixs, voxels] += vote
+
+        fused[..., z0:z1] = label_values[votes.argmax(axis=0)].reshape(
+            shape[:-1] + (z1 - z0,)
+        )
+
+    out = nib.Nifti1Image(fused, reference.affine, header=reference.header)
+    nib.save(out, str(out_path))
+    return out_path
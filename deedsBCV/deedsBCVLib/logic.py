@@ -1,24 +1,54 @@
+import json
 import logging
 import os
-import platform
+import queue
 import shutil
 import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from pathlib import Path
 
+import nibabel as nib
 import numpy as np
 import slicer
 from slicer.ScriptedLoadableModule import *
 
+from deedsBCVLib import fields, store
+from deedsBCVLib.atlases import AtlasRegistrationMixin
+from deedsBCVLib.backends import BackendRegistry, benchmark_backends
+from deedsBCVLib.batch import BatchRegistrationMixin
+from deedsBCVLib.coalescing import (
+    RequestCoalescer,
+    RequestSupersededError,
+    request_key,
+    wait_future,
+)
+from deedsBCVLib.multiphase import MultiphaseRegistrationMixin
+from deedsBCVLib.profiling import Profiler
+from deedsBCVLib.tiled import TiledRegistrationMixin
 from deedsBCVLib.ui import deedsBCVParameterNode
 from deedsBCVLib.utils import (
     create_sub_process,
     create_tmp_folder,
+    fit_to_shape,
     np2nifty,
-    pad_smaller_along_depth,
+    reconcile_shapes,
+    shift_header,
+    wait_sub_process,
+    wait_with_rusage,
 )
 
 
-class deedsBCVLogic(ScriptedLoadableModuleLogic):
+class deedsBCVLogic(
+    AtlasRegistrationMixin,
+    BatchRegistrationMixin,
+    MultiphaseRegistrationMixin,
+    TiledRegistrationMixin,
+    ScriptedLoadableModuleLogic,
+):
     """This class should implement all the actual
     computation done by your module.  The interface
     should be such that other python code can import
@@ -32,6 +62,11 @@ class deedsBCVLogic(ScriptedLoadableModuleLogic):
     FIXED_FILENAME = 'fixed'
     OUTPUT_FOLDER = 'outputs'
     PREDICTION_BASENAME = 'pred'
+    INVERSE_BASENAME = 'pred_inverse'
+    PREVIEW_FOLDER = 'preview'
+    PREVIEW_DOWNSAMPLING = 2
+    PREVIEW_LEVELS = 2
+    RECONCILIATION_FILENAME = 'reconciliation.json'
 
     def __init__(self) -> None:
         """
@@ -44,10 +79,33 @@ class deedsBCVLogic(ScriptedLoadableModuleLogic):
         self.cancelRequested = False
 
         self.scriptPath = os.path.dirname(os.path.abspath(__file__))
-        self.binDir = None  # this will be determined dynamically
 
-        executableExt = '.exe' if platform.system() == 'Windows' else ''
-        self.linearExeFilename = 'linear' + executableExt
+        # builds of the executables found, one is selected per job (by cost)
+        self.backends = BackendRegistry().discover(self.scriptPath)
+        self.backendName = None  # forces a backend (by name)
+        self._job = threading.local()  # backend of the job in this thread
+
+        # worker threads cannot update the GUI: their logs (and callbacks
+        # like the preview one) wait here
+        self._pendingLogs = queue.SimpleQueue()
+        self._pendingCalls = queue.SimpleQueue()
+        self._liveProcesses = set()
+        self._liveProcessesLock = threading.Lock()
+
+        # stage timings, see `Profiler.export_chrome_trace`
+        self.profiler = Profiler()
+
+        # fixed warped into moving space, by the last symmetric `process`
+        self.inversePredPath = None
+
+        # save only the transform (see `store`), not the full volumes
+        self.compactOutputs = True
+
+        # inputs of different shape are padded (or cropped) to a common one
+        self.shapeReconciliationMode = 'pad'
+
+        # runs identical requests once, see `process`
+        self.coalescer = RequestCoalescer()
 
     def set_default_parameters(self, parameterNode):
         """
@@ -59,31 +117,109 @@ class deedsBCVLogic(ScriptedLoadableModuleLogic):
     def add_log(self, text):
         logging.info(text)
 
+        if threading.current_thread() is not threading.main_thread():
+            self._pendingLogs.put(text)
+            return
+
+        self._log_to_callback(text)
+
+    def _flush_pending_logs(self):
+        while not self._pendingLogs.empty():
+            self._log_to_callback(self._pendingLogs.get())
+
+    def _call_on_main_thread(self, function, *args):
+        """runs `function` now if on the main thread, else at its next
+        `_poll_events`"""
+
+        if threading.current_thread() is threading.main_thread():
+            function(*args)
+        else:
+            self._pendingCalls.put((function, args))
+
+    def _log_to_callback(self, text):
         if self.logCallback:
             self.logCallback(text)
         else:
             print('debug no log callback found')
 
-    def get_bin_folder(self):
-        if not (self.binDir):
-            self.binDir = self._find_bin_folder_or_except()
+    def get_bin_folder(self, required=()):
+        """folder of the backend of the job, else of the one selected now
+        (costs may have been benchmarked since), see `select_backend`"""
+
+        return self.select_backend(required=required).binDir
+
+    def select_backend(self, n_voxels=0, required=()):
+        """the backend of a job: the one forced (`backendName`, or the one
+        being benchmarked), else the cheapest that can run it (and has the
+        other `required` capabilities)"""
 
-        return self.binDir
+        required = {'linear', 'deformable', *required}
+        backend = getattr(self._job, 'backend', None)
+        if backend is None and self.backendName is not None:
+            backend = self.backends.get(self.backendName)
 
-    def _find_bin_folder_or_except(self):
-        candidates = [
-            # build tree
-            os.path.join(self.scriptPath, '../../build/bin'),
+        if backend is not None:
+            if not backend.capabilities >= required:
+                raise ValueError(
+                    f'Backend {backend.name} cannot run this registration'
+                )
+            return backend
+
+        return self.backends.select(required, n_voxels)
+
+    @contextmanager
+    def _using_backend(self, backend):
+        previous = getattr(self._job, 'backend', None)
+        self._job.backend = backend
+        try:
+            yield backend
+        finally:
+            self._job.backend = previous
+
+    def benchmark_backends(
+        self,
+        fixed,
+        moving,
+        alsoAffineStep=True,
+        advancedParams=(1.60, 5, 8, 8, 5),
+        names=None,
+        repeats=1,
+    ):
+        """registers (`fixed`, `moving`) with each available backend (or the
+        ones in `names`), updates their costs and returns {name: seconds}"""
+
+        backends = [
+            x
+            for x in self.backends.available()
+            if names is None or x.name in names
         ]
 
-        for candidate in candidates:
-            candidate_path = os.path.join(candidate, self.linearExeFilename)
-            if os.path.isfile(candidate_path):
-                return os.path.abspath(candidate)
+        def _run_job(backend):
+            tempDir = create_tmp_folder()
+            try:
+                with self._using_backend(backend):
+                    self._process_or_except(
+                        tempDir,
+                        fixed,
+                        moving,
+                        (None, None),
+                        alsoAffineStep,
+                        advancedParams,
+                    )
+            finally:
+                shutil.rmtree(tempDir)
+
+        timings = benchmark_backends(backends, _run_job, fixed[0].size, repeats)
+        for name, seconds in timings.items():
+            self.add_log(f'Backend {name}: {seconds:.2f}s')
 
-        raise ValueError('bin not found')
+        return timings
 
     def _handleProcess(self, process, to_stdout=False):
+        if threading.current_thread() is not threading.main_thread():
+            # no GUI here: output lines are logged when polled
+            return self._wait_process_or_except(process, to_stdout)
+
         # save process output (if not logged) so that it can be displayed in case of an error
         processOutput = ''
 
@@ -105,15 +241,17 @@ class deedsBCVLogic(ScriptedLoadableModuleLogic):
                 # Code page conversion happens because `universal_newlines=True` sets process output to text mode.
                 pass
 
-            slicer.app.processEvents()  # give a chance to click Cancel button
+            self._poll_events()  # give a chance to click Cancel button
             if self.cancelRequested:
                 process.kill()
+                self._kill_live_processes()  # e.g the preview ones
                 self.add_log('Sub-process killed')
                 break
 
         process.stdout.close()
         self.add_log('Waiting for sub-process return code')
-        return_code = process.wait()
+        return_code, rusage = wait_with_rusage(process)
+        self._record_child_usage(process, rusage)
 
         if return_code and not self.cancelRequested:
             if processOutput:
@@ -121,6 +259,112 @@ class deedsBCVLogic(ScriptedLoadableModuleLogic):
 
             raise subprocess.CalledProcessError(return_code, 'deeds')
 
+    def _wait_process_or_except(self, process, to_stdout=False):
+        """thread-safe version of `_handleProcess`: cancel is handled by the
+        main thread (see `_wait_jobs`), which kills all live processes"""
+
+        with self._liveProcessesLock:
+            self._liveProcesses.add(process)
+
+        try:
+            return_code, processOutput, rusage = wait_sub_process(
+                process,
+                self._liveProcessesLock,
+                on_line=self.add_log if to_stdout else None,
+            )
+            self._record_child_usage(process, rusage)
+        finally:
+            with self._liveProcessesLock:
+                self._liveProcesses.discard(process)
+
+        if return_code and not self.cancelRequested:
+            if processOutput:
+                self.add_log(processOutput)
+            raise subprocess.CalledProcessError(return_code, 'deeds')
+
+    def _record_child_usage(self, process, rusage):
+        self.profiler.add_child_usage(
+            os.path.basename(process.args[0]),
+            process.pid,
+            rusage,
+            getattr(process, 'start_time', time.perf_counter()),
+            time.perf_counter(),
+        )
+
+    def _kill_live_processes(self):
+        with self._liveProcessesLock:
+            for process in self._liveProcesses:
+                process.kill()
+
+    def _wait_jobs(self, futures, stopOnError=True):
+        """keeps the GUI responsive while `futures` run in worker threads.
+        If not `stopOnError`, failed jobs are logged and give None"""
+
+        def _failed(f):  # cancelled futures have no exception to get
+            return not f.cancelled() and f.exception() is not None
+
+        firstFailure = None  # the one that stopped the others
+        pending = set(futures)
+        while pending:
+            done, pending = wait(
+                pending, timeout=0.1, return_when=FIRST_EXCEPTION
+            )
+            self._flush_pending_logs()
+            slicer.app.processEvents()  # give a chance to click Cancel button
+
+            failed = [f for f in futures if f in done and _failed(f)]
+            if stopOnError and failed and firstFailure is None:
+                firstFailure = failed[0].exception()
+
+            if self.cancelRequested or firstFailure is not None:
+                self._kill_live_processes()
+                for f in pending:
+                    f.cancel()
+                # `wait` only sees those notified by an executor, not the
+                # ones of a `StagedPipeline`
+                pending = {f for f in pending if not f.cancelled()}
+
+        self._flush_pending_logs()
+        if self.cancelRequested:
+            raise ValueError('User requested cancel!')
+
+        if firstFailure is not None:  # not the errors of the jobs killed after
+            raise firstFailure
+
+        results = []
+        for f in futures:
+            if _failed(f):
+                self.add_log(f'Job failed! {str(f.exception())}')
+                results.append(None)
+            else:
+                results.append(f.result())
+
+        return results
+
+    def _run_mode(self, name, run, deleteTemporaryFiles=False, tempDir=None):
+        """runs `run(tempDir)` in a new working folder (or `tempDir`) and
+        returns (tempDir, its result); failures are logged and give None"""
+
+        self.isRunning = True
+        if tempDir is None:
+            tempDir = create_tmp_folder()
+        self.add_log(f'{name} is started in {tempDir}')
+
+        try:
+            self.cancelRequested = False
+            result = run(tempDir)
+        except Exception as e:
+            result = None
+            self.add_log(f'{name} failed! {str(e)}')
+        finally:
+            if deleteTemporaryFiles:
+                shutil.rmtree(tempDir)
+
+            self.isRunning = False
+            self.cancelRequested = False
+
+        return tempDir, result
+
     def create_linear_exe(
         self,
         moving_path,
@@ -142,10 +386,11 @@ class deedsBCVLogic(ScriptedLoadableModuleLogic):
         out_folder,
         advanced_params=(1.60, 5, 8, 8, 5),
     ):
-        process, affine_path = self.create_linear_exe(
-            moving_path, fixed_path, out_folder, advanced_params
-        )
-        self._handleProcess(process, to_stdout=True)
+        with self.profiler.stage('run_linear_exe'):
+            process, affine_path = self.create_linear_exe(
+                moving_path, fixed_path, out_folder, advanced_params
+            )
+            self._handleProcess(process, to_stdout=True)
 
         return affine_path + '_matrix.txt'  # deeds will append this
 
@@ -155,6 +400,8 @@ class deedsBCVLogic(ScriptedLoadableModuleLogic):
         fixed_path,
         affine_path=None,
         advanced_params=(1.60, 5, 8, 8, 5),
+        out_folder=None,
+        segmentation_path=None,
     ):
         def _build_stepped_param(init_value, n_steps):
             out = [
@@ -163,7 +410,10 @@ class deedsBCVLogic(ScriptedLoadableModuleLogic):
             ]
             return 'x'.join(map(str, out))
 
-        out_folder = Path(fixed_path).parents[0] / self.OUTPUT_FOLDER
+        if out_folder is None:
+            out_folder = Path(fixed_path).parents[0] / self.OUTPUT_FOLDER
+
+        out_folder = Path(out_folder)
         out_folder.mkdir(parents=True, exist_ok=True)
 
         (
@@ -195,6 +445,9 @@ class deedsBCVLogic(ScriptedLoadableModuleLogic):
         if affine_path is not None:
             cli_args += ['-A', affine_path]
 
+        if segmentation_path is not None:  # warped as *_deformed_seg.nii.gz
+            cli_args += ['-S', segmentation_path]
+
         exe_path = os.path.join(self.get_bin_folder(), 'deeds')
         return create_sub_process(exe_path, cli_args), out_folder
 
@@ -205,19 +458,134 @@ class deedsBCVLogic(ScriptedLoadableModuleLogic):
         affine_path=None,
         advanced_params=(1.60, 5, 8, 8, 5),
     ):
-        process, out_folder = self.create_deformable_exe(
-            moving_path, fixed_path, affine_path, advanced_params
-        )
-        self._handleProcess(process, to_stdout=True)
+        with self.profiler.stage('run_deformable_exe'):
+            process, out_folder = self.create_deformable_exe(
+                moving_path, fixed_path, affine_path, advanced_params
+            )
+            self._handleProcess(process, to_stdout=True)
 
         return str(out_folder / self.PREDICTION_BASENAME) + '_{}.nii.gz'.format(
             'deformed'
         )  # full path, e.g ...outputs/pred_deformed.nii.gz
 
+    def create_apply_exe(
+        self, moving_path, out_stem, deformed_path, affine_path=None
+    ):
+        """warps `moving_path` with the field in `out_stem`_displacements.dat"""
+
+        cli_args = ['-M', moving_path, '-O', out_stem, '-D', deformed_path]
+        if affine_path is not None:
+            cli_args += ['-A', affine_path]
+
+        exe_path = os.path.join(
+            self.get_bin_folder(required={'apply'}), 'applyBCV'
+        )
+        return create_sub_process(exe_path, cli_args)
+
+    def run_apply_exe(
+        self, moving_path, out_stem, deformed_path, affine_path=None
+    ):
+        with self.profiler.stage('run_apply_exe'):
+            process = self.create_apply_exe(
+                moving_path, out_stem, deformed_path, affine_path
+            )
+            self._handleProcess(process, to_stdout=True)
+
+        return deformed_path
+
+    def get_inverse_displacements(self, pred_path, affine_path=None):
+        """inverse of the (affine +) deformable transform of `pred_path`, as
+        a deformable-only field. It is cached next to the forward field, so it
+        is computed only once per result"""
+
+        out_folder = Path(pred_path).parent
+        inverse_path = out_folder / f'{self.INVERSE_BASENAME}_displacements.dat'
+        if inverse_path.exists():
+            return str(inverse_path)
+
+        shape = nib.load(pred_path).shape[::-1]  # nifti -> D, H, W
+        field = fields.read_displacements(
+            out_folder / f'{self.PREDICTION_BASENAME}_displacements.dat', shape
+        )
+        affine = (
+            None if affine_path is None else fields.read_affine(affine_path)
+        )
+
+        with self.profiler.stage('invert_displacements'):
+            inverse = fields.invert_displacements(field, shape, affine)
+
+        return fields.write_displacements(inverse, str(inverse_path))
+
+    def _process_preview_or_except(
+        self, tempDir, fixed, moving, alsoAffineStep, advancedParams
+    ):
+        """coarse registration: downsampled inputs, fewer levels"""
+
+        self.add_log('Computing preview...')
+
+        step = self.PREVIEW_DOWNSAMPLING
+        previewAffine = np.diag([step, step, step, 1.0])
+
+        def _downsample(x):
+            arr, header = x
+            header = previewAffine if header is None else header @ previewAffine
+            return np.ascontiguousarray(arr[::step, ::step, ::step]), header
+
+        (
+            regularisationParameter,
+            numLevelsParameter,
+            gridSpacingParameter,
+            maxSearchRadiusParameter,
+            stepQuantisationParameter,
+        ) = advancedParams
+
+        previewDir = Path(tempDir, self.PREVIEW_FOLDER)
+        previewDir.mkdir(parents=True, exist_ok=True)
+
+        with self.profiler.stage('preview'):
+            _, pred_path = self._process_or_except(
+                str(previewDir),
+                _downsample(fixed),
+                _downsample(moving),
+                (None, None),
+                alsoAffineStep,
+                (
+                    regularisationParameter,
+                    min(numLevelsParameter, self.PREVIEW_LEVELS),
+                    gridSpacingParameter,
+                    maxSearchRadiusParameter,
+                    stepQuantisationParameter,
+                ),
+            )
+
+        return pred_path
+
+    def _process_inverse_or_except(self, tempDir, affine_path, pred_path):
+        """fixed-to-moving direction, from the cached inverse field"""
+
+        self.add_log('Inverting displacements...')
+        self.get_inverse_displacements(pred_path, affine_path)
+
+        fixed_path = Path(tempDir) / f'{self.FIXED_FILENAME}.nii.gz'
+        if not fixed_path.exists():  # not staged
+            self.add_log('Fixed image not staged: not warping it')
+            return None
+
+        out_stem = str(Path(pred_path).parent / self.INVERSE_BASENAME)
+        return self.run_apply_exe(
+            str(fixed_path), out_stem, out_stem + '_deformed.nii.gz'
+        )
+
     def getParameterNode(self):
         return deedsBCVParameterNode(super().getParameterNode())
 
-    def _processParameterNode(self, parameterNode, deleteTemporaryFiles):
+    def _processParameterNode(
+        self,
+        parameterNode,
+        deleteTemporaryFiles,
+        previewCallback=None,
+        requestGroup=None,
+    ):
         if parameterNode.fixedVolume is None:
             fixed_arr = slicer.util.arrayFromVolume(parameterNode.fixedVolume)
             fixed_header = None  # todo get also header!
@@ -228,7 +596,7 @@ class deedsBCVLogic(ScriptedLoadableModuleLogic):
         moving_arr = slicer.util.arrayFromVolume(parameterNode.movingVolume)
         moving_header = None  # todo
 
-        self.process(
+        return self.process(
             (fixed_arr, fixed_header),
             (moving_arr, moving_header),
             load_result=(
@@ -251,6 +619,8 @@ class deedsBCVLogic(ScriptedLoadableModuleLogic):
             if len(str(parameterNode.outputFolder)) < 4
             else parameterNode.outputFolder,
             deleteTemporaryFiles=deleteTemporaryFiles,
+            previewCallback=previewCallback,
+            requestGroup=requestGroup,
         )
 
     def process(
@@ -262,43 +632,280 @@ class deedsBCVLogic(ScriptedLoadableModuleLogic):
         advancedParams: tuple[float] = (1.60, 5, 8, 8, 5),
         output_folder=None,
         deleteTemporaryFiles: bool = False,
+        symmetric: bool = False,
+        previewCallback=None,
+        requestGroup=None,
     ) -> None:
         """
         Run the processing algorithm.
         Can be used without GUI widget.
+        If `symmetric`, the fixed image is also warped into the moving space
+        (see `inversePredPath`), with the inverse of the computed transform.
+        If `previewCallback` is given, a coarse registration is run alongside
+        the full one, and its deformed path passed to it (on the main thread)
+        if it is done first.
+        Requests are run one at a time on a runner thread (see
+        `coalescer`): identical ones in flight are run once, and a queued one
+        is dropped if a newer one of the same `requestGroup` comes meanwhile.
+        On the main thread, events are processed while waiting, so this can
+        be called again from a GUI callback.
         """
 
-        self.isRunning = True
-        tempDir = create_tmp_folder()
-        self.add_log(f'Registration is started in {tempDir}')
-
-        try:
-            self.cancelRequested = False
-
-            _, pred_path = self._process_or_except(
-                tempDir,
+        with self.profiler.stage('request_key'):
+            key = request_key(
                 fixed,
                 moving,
                 load_result,
                 alsoAffineStep,
                 advancedParams,
+                output_folder,
+                deleteTemporaryFiles,
+                symmetric,
             )
 
-            if output_folder is not None:  # this folder is already existing
-                self.save_to_output_folder(
-                    tempDir, Path(output_folder), advancedParams
+        poll = None  # worker threads can simply block
+        if threading.current_thread() is threading.main_thread():
+            poll = self._poll_events
+
+        tempDir = create_tmp_folder()  # Qt: not on the runner thread
+        try:
+            future, isNew = self.coalescer.submit(
+                key,
+                lambda: self._process_once(
+                    tempDir,
+                    fixed,
+                    moving,
+                    load_result,
+                    alsoAffineStep,
+                    advancedParams,
+                    output_folder,
+                    deleteTemporaryFiles,
+                    symmetric,
+                    previewCallback,
+                ),
+                requestGroup,
+            )
+            if not isNew:  # the pending request has its own folder
+                shutil.rmtree(tempDir)
+                self.add_log(
+                    'The same registration is already running: joining it'
                 )
+
+            return wait_future(future, poll)
+        except RequestSupersededError:
+            shutil.rmtree(tempDir)
+            self.add_log('Registration superseded by a newer request')
         except Exception as e:
-            pred_path = None
             self.add_log(f'Registration failed! {str(e)}')
         finally:
-            if deleteTemporaryFiles:
-                shutil.rmtree(tempDir)
+            if poll is not None:  # the last logs of the runner thread
+                self._flush_pending_logs()
 
-            self.isRunning = False
-            self.cancelRequested = False
+        return None, None
+
+    def cancel(self, requestGroup=None):
+        """stops the running registration and, if given, drops the queued
+        requests of `requestGroup`"""
 
-        return tempDir, pred_path
+        if requestGroup is not None:
+            self.coalescer.supersede(requestGroup)
+
+        self.cancelRequested = True
+
+    def _poll_events(self):
+        self._flush_pending_logs()
+        while not self._pendingCalls.empty():
+            function, args = self._pendingCalls.get()
+            function(*args)
+
+        slicer.app.processEvents()  # give a chance to click Cancel button
+        if self.cancelRequested:  # see `_wait_process_or_except`
+            self._kill_live_processes()
+
+    def _process_once(
+        self,
+        tempDir,
+        fixed,
+        moving,
+        load_result,
+        alsoAffineStep,
+        advancedParams,
+        output_folder,
+        deleteTemporaryFiles,
+        symmetric,
+        previewCallback,
+    ):
+        self.inversePredPath = None
+
+        def _run(tempDir):
+            preview = None
+            try:
+                if previewCallback is not None and all(
+                    x is None for x in load_result
+                ):
+                    preview = self._start_preview(
+                        previewCallback,
+                        tempDir,
+                        fixed,
+                        moving,
+                        alsoAffineStep,
+                        advancedParams,
+                    )
+
+                affine_path, pred_path = self._process_or_except(
+                    tempDir,
+                    fixed,
+                    moving,
+                    load_result,
+                    alsoAffineStep,
+                    advancedParams,
+                )
+
+                if symmetric:
+                    self.inversePredPath = self._process_inverse_or_except(
+                        tempDir, affine_path, pred_path
+                    )
+
+                if output_folder is not None:  # this folder already exists
+                    with self.profiler.stage('save_to_output_folder'):
+                        self.save_to_output_folder(
+                            tempDir,
+                            Path(output_folder),
+                            advancedParams,
+                            affine_path,
+                        )
+                return pred_path
+            finally:
+                if preview is not None:  # it writes in tempDir: wait for it
+                    previewFuture, previewDone = preview
+                    previewDone.set()
+                    wait([previewFuture])
+
+        return self._run_mode(
+            'Registration', _run, deleteTemporaryFiles, tempDir
+        )
+
+    def _start_preview(
+        self,
+        previewCallback,
+        tempDir,
+        fixed,
+        moving,
+        alsoAffineStep,
+        advancedParams,
+    ):
+        """runs `_process_preview_or_except` alongside the full registration;
+        `previewCallback` gets its result on the main thread, unless the full
+        registration is done by then"""
+
+        done = threading.Event()  # set once the full registration is over
+
+        def _on_preview(future):
+            if future.exception() is not None:
+                self.add_log(f'Preview failed! {str(future.exception())}')
+            else:
+                self._call_on_main_thread(_show, future.result())
+
+        def _show(pred_path):
+            if not done.is_set():  # else the full result is coming already
+                previewCallback(pred_path)
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        future = executor.submit(
+            self._process_preview_or_except,
+            tempDir,
+            fixed,
+            moving,
+            alsoAffineStep,
+            advancedParams,
+        )
+        executor.shutdown(wait=False)  # its thread ends with the preview
+
+        future.add_done_callback(_on_preview)
+        return future, done
+
+    def _register_in_thread_or_except(
+        self,
+        moving_path,
+        fixed_path,
+        out_folder,
+        alsoAffineStep,
+        advancedParams,
+        segmentation_path=None,
+    ):
+        """same as `_process_or_except` (registration part only), but can run
+        in a worker thread. Returns (affine, deformed) paths"""
+
+        backend = self.select_backend(
+            n_voxels=int(np.prod(nib.load(fixed_path).shape))
+        )
+        with self._using_backend(backend):
+            return self._register_with_executables_or_except(
+                moving_path,
+                fixed_path,
+                out_folder,
+                alsoAffineStep,
+                advancedParams,
+                segmentation_path,
+            )
+
+    def _register_with_executables_or_except(
+        self,
+        moving_path,
+        fixed_path,
+        out_folder,
+        alsoAffineStep,
+        advancedParams,
+        segmentation_path,
+    ):
+        out_folder = Path(out_folder)
+        out_folder.mkdir(parents=True, exist_ok=True)
+
+        affine_path = None
+        if alsoAffineStep and not self.cancelRequested:
+            process, affine_path = self.create_linear_exe(
+                moving_path, fixed_path, str(out_folder), advancedParams
+            )
+            self._wait_process_or_except(process)
+            affine_path += '_matrix.txt'  # deeds will append this
+
+        if self.cancelRequested:
+            raise ValueError('User requested cancel!')
+
+        process, _ = self.create_deformable_exe(
+            moving_path,
+            fixed_path,
+            affine_path,
+            advancedParams,
+            out_folder=out_folder,
+            segmentation_path=segmentation_path,
+        )
+        self._wait_process_or_except(process)
+
+        pred_stem = str(out_folder / self.PREDICTION_BASENAME)
+        return affine_path, pred_stem + '_deformed.nii.gz'
+
+    def stage_distributed_job(
+        self,
+        sharedFolder,
+        fixed: tuple[np.array, None],  # todo header]
+        moving: tuple[np.array, None],  # todo header]
+        alsoAffineStep: bool = True,
+        advancedParams: tuple[float] = (1.60, 5, 8, 8, 5),
+    ):
+        """stages inputs in `sharedFolder` (reachable by all the workers),
+        returns the job to submit to a `distributed.Coordinator`"""
+
+        staged_dir = Path(sharedFolder, 'staged', uuid.uuid4().hex)
+        staged_dir.mkdir(parents=True, exist_ok=True)
+        self._pre_process(str(staged_dir), fixed, moving)
+
+        return {
+            'staged_dir': str(staged_dir),
+            'result_dir': str(Path(sharedFolder, 'results')),
+            'alsoAffineStep': alsoAffineStep,
+            'advancedParams': list(advancedParams),
+        }
 
     def _process_or_except(
         self,
@@ -309,7 +916,30 @@ class deedsBCVLogic(ScriptedLoadableModuleLogic):
         alsoAffineStep,
         advancedParams,
     ) -> None:
-        fixed_path, moving_path = self._pre_process(tempDir, fixed, moving)
+        backend = self.select_backend(fixed[0].size)
+        with self._using_backend(backend):
+            return self._process_executables_or_except(
+                tempDir,
+                fixed,
+                moving,
+                load_result,
+                alsoAffineStep,
+                advancedParams,
+            )
+
+    def _process_executables_or_except(
+        self,
+        tempDir,
+        fixed,
+        moving,
+        load_result,
+        alsoAffineStep,
+        advancedParams,
+    ):
+        self.add_log(f'Registering with {self._job.backend.name}...')
+
+        with self.profiler.stage('pre_process'):
+            fixed_path, moving_path = self._pre_process(tempDir, fixed, moving)
 
         out_folder = Path(tempDir, self.OUTPUT_FOLDER)
         out_folder.mkdir(parents=True, exist_ok=True)
@@ -353,19 +983,66 @@ class deedsBCVLogic(ScriptedLoadableModuleLogic):
         if self.cancelRequested:
             raise ValueError('User requested cancel!')
 
-        # todo change affine header of moved (pred_path) to fixed's (fixed_path) or moving's (moving_path)
+        # todo change affine header of moved (pred_path) to fixed's
+        # (fixed_path) or moving's (moving_path)
 
         self.add_log('Done :)')
         return affine_path, pred_path
 
     def save_to_output_folder(
-        self, working_folder, output_folder, advancedParams
+        self, working_folder, output_folder, advancedParams, affine_path=None
     ):
+        """`affine_path` is the affine the registration used (computed, or
+        given as a file), if any"""
+
+        pred_stem = (
+            Path(working_folder) / self.OUTPUT_FOLDER / self.PREDICTION_BASENAME
+        )
+        pred_path = Path(f'{pred_stem}_deformed.nii.gz')
+        displacements_path = Path(f'{pred_stem}_displacements.dat')
+
+        if self.compactOutputs and displacements_path.exists():
+            store.save_compact_transform(
+                output_folder,
+                displacements_path,
+                nib.load(pred_path).shape[::-1],  # nifti -> D, H, W
+                affine_path=affine_path,
+                inverse_displacements_path=pred_stem.parent
+                / f'{self.INVERSE_BASENAME}_displacements.dat',
+                metadata={
+                    'params': list(advancedParams),
+                    'reconciliation': self.load_reconciliation(working_folder),
+                },
+            )
+        else:
+            self._copy_to_output_folder(
+                working_folder, output_folder, affine_path
+            )
+
+        with open(output_folder / 'params.txt', 'w') as fp:
+            fp.write(
+                ','.join(
+                    map(
+                        lambda x: f'{x:.5f}',
+                        advancedParams,
+                    )
+                )
+            )
+
+    def _copy_to_output_folder(
+        self, working_folder, output_folder, affine_path=None
+    ):
+        if affine_path is not None:  # not always in the working folder
+            shutil.copy(affine_path, output_folder / store.AFFINE_FILENAME)
+
         for file_name in [
             f'{self.FIXED_FILENAME}.nii.gz',
             f'{self.MOVING_FILENAME}.nii.gz',
             '{}_{}.nii.gz'.format(self.PREDICTION_BASENAME, 'deformed'),
-            'affine_matrix.txt',
+            f'{self.PREDICTION_BASENAME}_displacements.dat',
+            f'{self.INVERSE_BASENAME}_displacements.dat',
+            f'{self.INVERSE_BASENAME}_deformed.nii.gz',
+            self.RECONCILIATION_FILENAME,
         ]:
             file_path = Path(working_folder) / file_name
             if not file_path.exists():
@@ -375,30 +1052,112 @@ class deedsBCVLogic(ScriptedLoadableModuleLogic):
 
             if file_path.exists():
                 shutil.copy(file_path, output_folder / file_name)
+            else:
+                self.add_log(f'Cannot copy {str(file_path)} to output folder!')
 
-            self.add_log(f'Cannot copy {str(file_path)} to output folder!')
+    def regenerate_deformed(self, output_folder, moving, inverse=False):
+        """deformed image of a compact result (see `save_to_output_folder`),
+        computed with `moving` on the first request, then kept there.
+        If `inverse`, `moving` is the fixed image, warped by the inverse
+        transform of a symmetric registration"""
 
-        with open(output_folder / 'params.txt', 'w') as fp:
-            fp.write(
-                ','.join(
-                    map(
-                        lambda x: f'{x:.5f}',
-                        advancedParams,
-                    )
-                )
+        output_folder = Path(output_folder)
+        basename = (
+            self.INVERSE_BASENAME if inverse else self.PREDICTION_BASENAME
+        )
+        pred_path = output_folder / f'{basename}_deformed.nii.gz'
+        if pred_path.exists():
+            return str(pred_path)
+
+        self.add_log('Regenerating deformed image...')
+        metadata = store.load_metadata(output_folder)
+        tempDir = create_tmp_folder()
+
+        try:
+            moving_arr, moving_header = moving
+            moving_path = os.path.join(
+                tempDir, f'{self.MOVING_FILENAME}.nii.gz'
+            )
+            # placed where it was when registered (centered if unknown)
+            offset = None
+            reconciliation = metadata.get('reconciliation')
+            if reconciliation is not None:
+                offset = reconciliation[
+                    'fixed_offset' if inverse else 'moving_offset'
+                ]
+            moving_arr, offset = fit_to_shape(
+                moving_arr, metadata['shape'], offset=offset
+            )
+            np2nifty(
+                moving_arr,
+                moving_path,
+                affine=shift_header(moving_header, offset),
+            )
+
+            out_stem = os.path.join(tempDir, self.PREDICTION_BASENAME)
+            fields.write_displacements(
+                store.load_displacements(output_folder, inverse),
+                out_stem + '_displacements.dat',
             )
+            self.run_apply_exe(
+                moving_path,
+                out_stem,
+                str(pred_path),
+                # the inverse field already accounts for the affine
+                None if inverse else store.affine_path_or_none(output_folder),
+            )
+        finally:
+            shutil.rmtree(tempDir)
+
+        return str(pred_path)
+
+    def _reconcile_inputs(self, folder, fixed, moving):
+        """brings inputs to a common shape; the shifts this introduces go in
+        the headers and in `folder`/reconciliation.json"""
+
+        (fixed_arr, fixed_header), (moving_arr, moving_header) = fixed, moving
+
+        fixed_arr, moving_arr, reconciliation = reconcile_shapes(
+            fixed_arr, moving_arr, mode=self.shapeReconciliationMode
+        )
+        self._save_reconciliation(folder, reconciliation)
+
+        return (
+            (
+                fixed_arr,
+                shift_header(fixed_header, reconciliation['fixed_offset']),
+            ),
+            (
+                moving_arr,
+                shift_header(moving_header, reconciliation['moving_offset']),
+            ),
+        )
+
+    def _save_reconciliation(self, folder, reconciliation):
+        with open(Path(folder) / self.RECONCILIATION_FILENAME, 'w') as fp:
+            json.dump(reconciliation, fp)
+
+    def load_reconciliation(self, folder):
+        """shape and offsets of the inputs staged in `folder` (None if
+        unknown), see `utils.reconcile_shapes`"""
+
+        path = Path(folder) / self.RECONCILIATION_FILENAME
+        if not path.exists():
+            return None
+
+        with open(path) as fp:
+            return json.load(fp)
 
     def _pre_process(self, folder, fixed, moving):
-        """pad smaller input, and save as .nii.gz"""
+        """bring inputs to a common shape, and save as .nii.gz"""
 
         self.add_log('Pre-processing...')
 
-        fixed_arr, fixed_header = fixed
-        moving_arr, moving_header = moving
-
         # todo check if fixed is None (can be if using pre-calc results)
 
-        fixed_arr, moving_arr = pad_smaller_along_depth(fixed_arr, moving_arr)
+        (fixed_arr, fixed_header), (moving_arr, moving_header) = (
+            self._reconcile_inputs(folder, fixed, moving)
+        )
         fixed_path, moving_path = (
             os.path.join(folder, f'{self.FIXED_FILENAME}.nii.gz'),
             os.path.join(folder, f'{self.MOVING_FILENAME}.nii.gz'),
@@ -0,0 +1,129 @@
+"""Multi-phase studies: phases sharing one geometry are registered once,
+the transform is then applied to each of them."""
+
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from deedsBCVLib.utils import fit_to_shape, np2nifty, shift_header
+
+
+class MultiphaseRegistrationMixin:
+    """multi-phase registration mode of `deedsBCVLogic`"""
+
+    PHASE_BASENAME = 'phase_{:02d}'
+
+    def process_multiphase(
+        self,
+        fixed: tuple[np.array, None],  # todo header]
+        phases: list[tuple[np.array, None]],  # todo header]
+        referencePhase: int | None = 0,
+        alsoAffineStep: bool = True,
+        advancedParams: tuple[float] = (1.60, 5, 8, 8, 5),
+        maxConcurrentJobs: int = 4,
+        output_folder=None,
+        deleteTemporaryFiles: bool = False,
+    ):
+        """
+        Registers a multi-phase moving study (phases sharing geometry) once,
+        on `referencePhase` (or, if None, on the average of the normalized
+        phases), then applies the transform to all the phases.
+        Returns the deformed path of each phase.
+        """
+
+        def _run(tempDir):
+            pred_paths = self._process_multiphase_or_except(
+                tempDir,
+                fixed,
+                phases,
+                referencePhase,
+                alsoAffineStep,
+                advancedParams,
+                maxConcurrentJobs,
+            )
+
+            if output_folder is not None:  # this folder is already existing
+                for pred_path in pred_paths:
+                    shutil.copy(pred_path, Path(output_folder))
+            return pred_paths
+
+        return self._run_mode(
+            'Multi-phase registration', _run, deleteTemporaryFiles
+        )
+
+    def _process_multiphase_or_except(
+        self,
+        tempDir,
+        fixed,
+        phases,
+        referencePhase,
+        alsoAffineStep,
+        advancedParams,
+        maxConcurrentJobs,
+    ):
+        for phase_arr, _ in phases:
+            assert phase_arr.shape == phases[0][0].shape
+
+        if referencePhase is None:  # fused channel
+            with self.profiler.stage('fuse_phases'):
+                reference_arr = np.zeros(phases[0][0].shape, dtype=np.float32)
+                for phase_arr, _ in phases:
+                    sample = phase_arr[::4, ::4, ::4]
+                    reference_arr += (phase_arr - sample.mean()) / (
+                        sample.std() or 1.0
+                    )
+                reference_arr /= len(phases)
+
+            reference = (reference_arr, phases[0][1])
+        else:
+            reference = phases[referencePhase]
+
+        affine_path, pred_path = self._process_or_except(
+            tempDir,
+            fixed,
+            reference,
+            (None, None),
+            alsoAffineStep,
+            advancedParams,
+        )
+
+        pred_stem = pred_path[: -len('_deformed.nii.gz')]
+        out_folder = Path(pred_path).parent
+        reconciliation = self.load_reconciliation(tempDir)
+
+        def _warp_phase(ix):
+            if ix == referencePhase:  # already warped
+                return pred_path
+
+            phase_arr, phase_header = phases[ix]
+            phase_path = str(
+                Path(tempDir, self.PHASE_BASENAME.format(ix) + '.nii.gz')
+            )
+            phase_arr, offset = fit_to_shape(
+                phase_arr,
+                reconciliation['shape'],
+                offset=reconciliation['moving_offset'],  # as the reference
+            )
+            np2nifty(
+                phase_arr, phase_path, affine=shift_header(phase_header, offset)
+            )
+
+            deformed_path = str(
+                out_folder / f'{self.PHASE_BASENAME.format(ix)}_deformed.nii.gz'
+            )
+            process = self.create_apply_exe(
+                phase_path, pred_stem, deformed_path, affine_path
+            )
+            self._wait_process_or_except(process)
+            return deformed_path
+
+        self.add_log(f'Warping {len(phases)} phases...')
+        with (
+            self.profiler.stage('warp_phases', n_phases=len(phases)),
+            ThreadPoolExecutor(max_workers=maxConcurrentJobs) as executor,
+        ):
+            return self._wait_jobs(
+                [executor.submit(_warp_phase, ix) for ix in range(len(phases))]
+            )
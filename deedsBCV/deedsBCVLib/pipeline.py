@@ -0,0 +1,88 @@
+import queue
+import threading
+from concurrent.futures import Future, InvalidStateError
+
+_DONE = object()  # end of stream
+
+
+class StagedPipeline:
+    """Runs items through `stages`, a list of (name, function), each stage in
+    its own thread: while item N is in stage i, item N+1 can be in stage i-1.
+    Stages are connected by bounded queues, so a fast stage cannot run too
+    far ahead of a slow one (backpressure).
+
+    `submit` returns one future per item, done when the item leaves the last
+    stage. A cancelled (or failed) item skips the remaining stages; `join`
+    waits for the stage threads of the last `submit`.
+    """
+
+    def __init__(self, stages, queue_size=1, profiler=None):
+        self.stages = stages
+        self.queueSize = queue_size
+        self.profiler = profiler
+        self._threads = []
+
+    def submit(self, items):
+        futures = [Future() for _ in items]
+        queues = [queue.Queue(maxsize=self.queueSize) for _ in self.stages[1:]]
+        self._threads = []
+
+        for i, (name, function) in enumerate(self.stages):
+            source = (
+                enumerate(items) if i == 0 else iter(queues[i - 1].get, _DONE)
+            )
+            sink = queues[i] if i < len(queues) else None
+
+            thread = threading.Thread(
+                target=self._run_stage,
+                args=(name, function, source, sink, futures),
+                name=f'pipeline-{name}',
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+        return futures
+
+    def join(self, timeout=None):
+        """waits (up to `timeout` per stage) for the stages to end, returns
+        whether they all did"""
+
+        for thread in self._threads:
+            thread.join(timeout)
+
+        return not any(thread.is_alive() for thread in self._threads)
+
+    def _run_stage(self, name, function, source, sink, futures):
+        for ix, value in source:
+            future = futures[ix]
+            if future.done():  # cancelled, or failed in a previous stage
+                continue
+
+            try:
+                if self.profiler is None:
+                    value = function(value)
+                else:
+                    with self.profiler.stage(name, item=ix):
+                        value = function(value)
+            except BaseException as e:
+                _set_future(future, exception=e)
+                continue
+
+            if sink is None:
+                _set_future(future, result=value)
+            else:
+                sink.put((ix, value))  # blocks while the next stage is busy
+
+        if sink is not None:
+            sink.put(_DONE)
+
+
+def _set_future(future, result=None, exception=None):
+    try:
+        if exception is None:
+            future.set_result(result)
+        else:
+            future.set_exception(exception)
+    except InvalidStateError:  # cancelled meanwhile
+        pass
@@ -0,0 +1,151 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+
+class Profiler:
+    """Collects stage timings (and optionally cProfile stats, tracemalloc
+    peaks and child-process resource usage) as structured records, that can
+    be exported as JSON or as a Chrome trace (chrome://tracing, Perfetto).
+    Only the last `max_records` records are kept."""
+
+    def __init__(
+        self,
+        enabled=True,
+        with_cprofile=False,
+        with_tracemalloc=False,
+        max_records=10000,
+    ):
+        self.enabled = enabled
+        self.withCProfile = with_cprofile
+        self.withTracemalloc = with_tracemalloc
+
+        self.records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+        self._local = threading.local()  # per-thread stage nesting
+        self._origin = time.perf_counter()
+
+    def clear(self):
+        with self._lock:
+            self.records.clear()
+
+    def _add_record(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    @contextmanager
+    def stage(self, name, **args):
+        if not self.enabled:
+            yield
+            return
+
+        depth = getattr(self._local, 'depth', 0)
+        self._local.depth = depth + 1
+
+        profile = None
+        if self.withCProfile and depth == 0:  # cProfile cannot nest
+            profile = cProfile.Profile()
+            profile.enable()
+
+        if self.withTracemalloc:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            if depth == 0:
+                tracemalloc.reset_peak()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self._local.depth = depth
+
+            record = {
+                'name': name,
+                'kind': 'stage',
+                'start': start - self._origin,
+                'duration': end - start,
+                'thread': threading.get_ident(),
+                'args': args,
+            }
+
+            if profile is not None:
+                profile.disable()
+                stats_out = io.StringIO()
+                pstats.Stats(profile, stream=stats_out).sort_stats(
+                    'cumulative'
+                ).print_stats(20)
+                record['profile'] = stats_out.getvalue()
+
+            if self.withTracemalloc:
+                # peak is since the outermost stage started
+                record['tracemalloc_peak'] = tracemalloc.get_traced_memory()[1]
+
+            self._add_record(record)
+
+    def add_child_usage(self, name, pid, rusage, start, end):
+        """`rusage` as returned by `os.wait4` (None if not available)"""
+
+        if not self.enabled:
+            return
+
+        record = {
+            'name': name,
+            'kind': 'process',
+            'start': start - self._origin,
+            'duration': end - start,
+            'thread': threading.get_ident(),
+            'args': {'pid': pid},
+        }
+
+        if rusage is not None:
+            # ru_maxrss is in kilobytes on Linux, bytes on macOS
+            rss_unit = 1 if sys.platform == 'darwin' else 1024
+            record['args'].update(
+                {
+                    'cpu_user': rusage.ru_utime,
+                    'cpu_system': rusage.ru_stime,
+                    'max_rss': rusage.ru_maxrss * rss_unit,
+                }
+            )
+
+        self._add_record(record)
+
+    def export_records(self, out_path=None):
+        with self._lock:
+            records = list(self.records)
+
+        if out_path is not None:
+            with open(out_path, 'w') as fp:
+                json.dump(records, fp, indent=2)
+
+        return records
+
+    def export_chrome_trace(self, out_path):
+        pid = os.getpid()
+        events = [
+            {
+                'name': record['name'],
+                'cat': record['kind'],
+                'ph': 'X',  # complete event
+                'ts': record['start'] * 1e6,
+                'dur': record['duration'] * 1e6,
+                'pid': pid,
+                'tid': record['thread'],
+                'args': record['args'],
+            }
+            for record in self.export_records()
+        ]
+
+        with open(out_path, 'w') as fp:
+            json.dump({'traceEvents': events}, fp)
+
+        return out_path
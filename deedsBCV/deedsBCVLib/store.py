@@ -0,0 +1,116 @@
+"""Compact registration artifacts: instead of full volumes, only the affine
+and the displacement fields (forward and, if computed, inverse) at
+control-point resolution are kept, quantized to int16 (per chunk of slices)
+and compressed. Deformed images can be regenerated from them (see
+`deedsBCVLogic.regenerate_deformed`)."""
+
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from deedsBCVLib import fields
+
+FIELD_FILENAME = 'transform.npz'
+INVERSE_FIELD_FILENAME = 'transform_inverse.npz'
+META_FILENAME = 'transform.json'
+AFFINE_FILENAME = 'affine_matrix.txt'
+
+_QUANTIZATION_LEVELS = np.iinfo(np.int16).max
+
+
+def _save_field(path, field, chunk_depth):
+    chunks = {}
+    for i, k0 in enumerate(range(0, field.shape[1], chunk_depth)):
+        chunk = field[:, k0 : k0 + chunk_depth]
+        scale = float(np.abs(chunk).max()) / _QUANTIZATION_LEVELS or 1.0
+
+        chunks[f'chunk_{i:04d}'] = np.round(chunk / scale).astype(np.int16)
+        chunks[f'scale_{i:04d}'] = np.float32(scale)
+
+    np.savez_compressed(path, **chunks)
+    return len(chunks) // 2
+
+
+def save_compact_transform(
+    folder,
+    displacements_path,
+    shape,
+    affine_path=None,
+    metadata=None,
+    chunk_depth=8,
+    inverse_displacements_path=None,
+):
+    """`shape` is the (D, H, W) of the fixed image, `affine_path` the affine
+    used with the displacements (if any)"""
+
+    folder = Path(folder)
+    grid_step = fields.infer_grid_step(displacements_path, shape)
+    n_chunks = _save_field(
+        folder / FIELD_FILENAME,
+        fields.read_displacements(displacements_path, shape, grid_step),
+        chunk_depth,
+    )
+
+    has_inverse = (
+        inverse_displacements_path is not None
+        and Path(inverse_displacements_path).exists()
+    )
+    if has_inverse:  # same grid as the forward field
+        _save_field(
+            folder / INVERSE_FIELD_FILENAME,
+            fields.read_displacements(
+                inverse_displacements_path, shape, grid_step
+            ),
+            chunk_depth,
+        )
+
+    if affine_path is not None:  # the transform is wrong without it
+        if not Path(affine_path).exists():
+            raise ValueError(f'Affine {affine_path} not found')
+        shutil.copy(affine_path, folder / AFFINE_FILENAME)
+
+    with open(folder / META_FILENAME, 'w') as fp:
+        json.dump(
+            {
+                'shape': list(shape),
+                'grid_step': grid_step,
+                'n_chunks': n_chunks,
+                'inverse': has_inverse,
+                **(metadata or {}),
+            },
+            fp,
+            indent=2,
+        )
+
+    return folder / FIELD_FILENAME
+
+
+def load_metadata(folder):
+    with open(Path(folder) / META_FILENAME) as fp:
+        return json.load(fp)
+
+
+def load_displacements(folder, inverse=False):
+    """the (dequantized) field, as `fields.read_displacements`"""
+
+    metadata = load_metadata(folder)
+    if inverse and not metadata.get('inverse', False):
+        raise ValueError(f'No inverse transform saved in {folder}')
+
+    filename = INVERSE_FIELD_FILENAME if inverse else FIELD_FILENAME
+    with np.load(Path(folder) / filename) as chunks:
+        return np.concatenate(
+            [
+                chunks[f'chunk_{i:04d}'].astype(np.float32)
+                * chunks[f'scale_{i:04d}']
+                for i in range(metadata['n_chunks'])
+            ],
+            axis=1,
+        )
+
+
+def affine_path_or_none(folder):
+    affine_path = Path(folder) / AFFINE_FILENAME
+    return str(affine_path) if affine_path.exists() else None
@@ -0,0 +1,205 @@
+"""Registration of volumes too large for one deeds process, tile by tile
+along depth (see `tiling`)."""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+
+from deedsBCVLib import fields, tiling
+from deedsBCVLib.utils import depth_slab, np2nifty, sampled_min, shift_header
+
+
+class TiledRegistrationMixin:
+    """tiled registration mode of `deedsBCVLogic`"""
+
+    TILE_FOLDER = 'tile_{:03d}'
+    WARP_FOLDER = 'warp_{:03d}'
+
+    def process_tiled(
+        self,
+        fixed: tuple[np.array, None],  # todo header]
+        moving: tuple[np.array, None],  # todo header]
+        tileDepth: int = 128,
+        tileOverlap: int = 32,
+        advancedParams: tuple[float] = (1.60, 5, 8, 8, 5),
+        maxConcurrentJobs: int = 2,
+        output_folder=None,
+        deleteTemporaryFiles: bool = False,
+    ):
+        """
+        Registration of volumes too large for one deeds process: overlapping
+        slabs (along depth) are registered independently, their displacement
+        fields blended into one, then applied to the moving volume slab by
+        slab.
+        Only the deformable step is done (one affine per slab would not fit).
+        """
+
+        def _run(tempDir):
+            pred_path = self._process_tiled_or_except(
+                tempDir,
+                fixed,
+                moving,
+                tileDepth,
+                tileOverlap,
+                advancedParams,
+                maxConcurrentJobs,
+            )
+
+            if output_folder is not None:  # this folder is already existing
+                with self.profiler.stage('save_to_output_folder'):
+                    self.save_to_output_folder(
+                        tempDir, Path(output_folder), advancedParams
+                    )
+            return pred_path
+
+        return self._run_mode('Tiled registration', _run, deleteTemporaryFiles)
+
+    def _process_tiled_or_except(
+        self,
+        tempDir,
+        fixed,
+        moving,
+        tileDepth,
+        tileOverlap,
+        advancedParams,
+        maxConcurrentJobs,
+    ):
+        (fixed_arr, fixed_header), (moving_arr, moving_header) = (
+            self._reconcile_inputs(tempDir, fixed, moving)
+        )
+
+        # tiles (and the whole volume) must be aligned to the control points
+        _, numLevelsParameter, gridSpacingParameter, _, _ = advancedParams
+        grid_step = gridSpacingParameter - (numLevelsParameter - 1)
+        depth = tiling.round_up(fixed_arr.shape[0], grid_step)
+
+        # slabs are padded to `depth` lazily (see `depth_slab`): the shift
+        # this introduces is recorded with the reconciliation ones
+        shift = (depth - fixed_arr.shape[0]) // 2
+        if shift > 0:
+            reconciliation = self.load_reconciliation(tempDir)
+            reconciliation['shape'][0] = depth
+            reconciliation['fixed_offset'][0] += shift
+            reconciliation['moving_offset'][0] += shift
+            self._save_reconciliation(tempDir, reconciliation)
+
+            fixed_header = shift_header(fixed_header, (shift, 0, 0))
+            moving_header = shift_header(moving_header, (shift, 0, 0))
+        overlap = tiling.round_up(tileOverlap, grid_step)
+        tile_depth = tiling.round_up(tileDepth, grid_step)
+        ranges = tiling.tile_ranges(depth, tile_depth, overlap)
+        self.add_log(f'Registering {len(ranges)} tiles...')
+
+        fill_values = (sampled_min(fixed_arr), sampled_min(moving_arr))
+
+        def _register_tile(ix):
+            z0, z1 = ranges[ix]
+            tile_folder = Path(tempDir, self.TILE_FOLDER.format(ix))
+            tile_folder.mkdir(parents=True, exist_ok=True)
+
+            fixed_path = str(tile_folder / f'{self.FIXED_FILENAME}.nii.gz')
+            moving_path = str(tile_folder / f'{self.MOVING_FILENAME}.nii.gz')
+            np2nifty(
+                depth_slab(fixed_arr, depth, z0, z1, fill_values[0]),
+                fixed_path,
+                affine=fixed_header,
+            )
+            np2nifty(
+                depth_slab(moving_arr, depth, z0, z1, fill_values[1]),
+                moving_path,
+                affine=moving_header,
+            )
+
+            _, pred_path = self._register_in_thread_or_except(
+                moving_path,
+                fixed_path,
+                tile_folder / self.OUTPUT_FOLDER,
+                False,  # deformable only
+                advancedParams,
+            )
+            return fields.read_displacements(
+                pred_path.replace('_deformed.nii.gz', '_displacements.dat'),
+                (z1 - z0,) + fixed_arr.shape[1:],
+                grid_step,
+            )
+
+        with (
+            self.profiler.stage('register_tiles', n_tiles=len(ranges)),
+            ThreadPoolExecutor(max_workers=maxConcurrentJobs) as executor,
+        ):
+            tile_fields = self._wait_jobs(
+                [
+                    executor.submit(_register_tile, ix)
+                    for ix in range(len(ranges))
+                ]
+            )
+
+        out_folder = Path(tempDir, self.OUTPUT_FOLDER)
+        out_folder.mkdir(parents=True, exist_ok=True)
+        out_stem = str(out_folder / self.PREDICTION_BASENAME)
+
+        with self.profiler.stage('blend_fields'):
+            field = tiling.blend_fields(
+                tile_fields, ranges, depth, grid_step, overlap
+            )
+        del tile_fields
+        fields.write_displacements(field, out_stem + '_displacements.dat')
+
+        # the field is applied slab by slab too: each one with a margin that
+        # covers its largest displacement along depth
+        warp_ranges = [
+            (z0, min(z0 + tile_depth, depth))
+            for z0 in range(0, depth, tile_depth)
+        ]
+        deformed = np.empty((depth,) + moving_arr.shape[1:], dtype=np.float32)
+
+        def _warp_slab(ix):
+            z0, z1 = warp_ranges[ix]
+            displacement = np.abs(field[0, z0 // grid_step : z1 // grid_step])
+            margin = tiling.round_up(
+                int(np.ceil(displacement.max())) + grid_step, grid_step
+            )
+            s0, s1 = max(z0 - margin, 0), min(z1 + margin, depth)
+
+            warp_folder = Path(tempDir, self.WARP_FOLDER.format(ix))
+            warp_folder.mkdir(parents=True, exist_ok=True)
+            moving_path = str(warp_folder / f'{self.MOVING_FILENAME}.nii.gz')
+            np2nifty(
+                depth_slab(moving_arr, depth, s0, s1, fill_values[1]),
+                moving_path,
+                affine=moving_header,
+            )
+
+            warp_stem = str(warp_folder / self.PREDICTION_BASENAME)
+            fields.write_displacements(
+                field[:, s0 // grid_step : s1 // grid_step],
+                warp_stem + '_displacements.dat',
+            )
+            process = self.create_apply_exe(
+                moving_path, warp_stem, warp_stem + '_deformed.nii.gz'
+            )
+            self._wait_process_or_except(process)
+
+            warped = nib.load(warp_stem + '_deformed.nii.gz').get_fdata(
+                dtype=np.float32
+            )
+            deformed[z0:z1] = warped.swapaxes(0, 2)[z0 - s0 : z1 - s0]
+
+        with (
+            self.profiler.stage('warp_slabs', n_slabs=len(warp_ranges)),
+            ThreadPoolExecutor(max_workers=maxConcurrentJobs) as executor,
+        ):
+            self._wait_jobs(
+                [
+                    executor.submit(_warp_slab, ix)
+                    for ix in range(len(warp_ranges))
+                ]
+            )
+
+        pred_path = out_stem + '_deformed.nii.gz'
+        np2nifty(deformed, pred_path, affine=fixed_header)  # fixed space
+
+        self.add_log('Done :)')
+        return pred_path
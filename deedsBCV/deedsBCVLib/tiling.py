@@ -0,0 +1,66 @@
+import numpy as np
+
+
+def round_up(x, multiple):
+    return -(-x // multiple) * multiple
+
+
+def tile_ranges(depth, tile_depth, overlap):
+    """[z0, z1) of overlapping slabs covering `depth`; the last one is moved
+    back (more overlap) rather than being thinner"""
+
+    if tile_depth >= depth:
+        return [(0, depth)]
+
+    step = tile_depth - overlap
+    if step <= 0:
+        raise ValueError('Tile overlap must be smaller than the tile depth')
+
+    ranges = []
+    for z0 in range(0, depth - overlap, step):
+        ranges.append(
+            (min(z0, depth - tile_depth), min(z0 + tile_depth, depth))
+        )
+        if z0 + tile_depth >= depth:
+            break
+
+    return ranges
+
+
+def blend_weights(n, overlap, ramp_start=True, ramp_end=True):
+    """1D weights of a tile of `n` points: linear ramps over the `overlap`
+    (in points) on the sides shared with other tiles, 1 elsewhere"""
+
+    k = np.arange(n, dtype=np.float32) + 0.5
+    weights = np.ones(n, dtype=np.float32)
+    if overlap > 0:
+        if ramp_start:
+            weights = np.minimum(weights, k / overlap)
+        if ramp_end:
+            weights = np.minimum(weights, (n - k) / overlap)
+
+    return weights
+
+
+def blend_fields(tile_fields, tile_ranges, depth, grid_step, overlap):
+    """blends (3, d, H, W) tile fields at control-point resolution into one
+    (3, depth, H, W) field; tiles must start on multiples of `grid_step`"""
+
+    shape = (3, depth // grid_step) + tile_fields[0].shape[2:]
+    blended = np.zeros(shape, dtype=np.float32)
+    total_weight = np.zeros(shape[1], dtype=np.float32)
+
+    for field, (z0, z1) in zip(tile_fields, tile_ranges):
+        k0 = z0 // grid_step
+        n = field.shape[1]
+        weights = blend_weights(
+            n,
+            overlap // grid_step,
+            ramp_start=z0 > 0,
+            ramp_end=z1 < depth,
+        )
+
+        blended[:, k0 : k0 + n] += weights[:, None, None] * field
+        total_weight[k0 : k0 + n] += weights
+
+    return blended / total_weight[:, None, None]
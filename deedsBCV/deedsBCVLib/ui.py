@@ -17,6 +17,7 @@ class deedsBCVParameterNode:
     maxSearchRadiusParameter: int = 8
     stepQuantisationParameter: int = 5
     includeAffineStepParameter: bool = True
+    previewParameter: bool = False
 
     affineParamsInputFilepath: Path
     deformableParamsInputFilepath: Path
@@ -1,5 +1,8 @@
+import contextlib
+import os
 import platform
 import subprocess
+import time
 
 import nibabel as nib
 
@@ -30,6 +33,107 @@ def create_tmp_folder():
     return create_folder(file_info.absoluteFilePath())
 
 
+def sampled_min(x, n_samples=2**16):
+    """estimate of `x.min()` on a strided subsample (a view, no copy)"""
+
+    stride = max(1, int(round((x.size / n_samples) ** (1 / x.ndim))))
+    return x[(slice(None, None, stride),) * x.ndim].min()
+
+
+def fit_to_shape(x, shape, value='min', offset=None):
+    """Centered (or at `offset`) pad and/or crop of `x` to `shape`, along all
+    axes. Cropping is a view, padding writes into one preallocated buffer.
+    Returns the volume and the offset (per axis) of x[0, 0, 0] in it"""
+
+    if offset is None:
+        offset = tuple((t - s) // 2 for s, t in zip(x.shape, shape))
+    offset = tuple(offset)
+
+    x = x[
+        tuple(
+            slice(max(-o, 0), max(-o, 0) + min(s, t))
+            for o, s, t in zip(offset, x.shape, shape)
+        )
+    ]  # crop
+    if x.shape == tuple(shape):
+        return x, offset
+
+    if value == 'min':
+        value = sampled_min(x)
+
+    out = np.full(shape, value, dtype=x.dtype)
+    out[
+        tuple(slice(max(o, 0), max(o, 0) + s) for o, s in zip(offset, x.shape))
+    ] = x
+    return out, offset
+
+
+def common_shape(shapes, mode='pad'):
+    """the largest (pad) or smallest (crop) extent of `shapes`, per axis"""
+
+    if mode not in ('pad', 'crop'):
+        raise ValueError(f'Unknown reconciliation mode {mode}')
+
+    reduce = max if mode == 'pad' else min
+    return tuple(map(reduce, *shapes))
+
+
+def reconcile_shapes(fixed_np, moving_np, mode='pad', value='min'):
+    """Brings both volumes to a common shape, padding (to the largest) or
+    cropping (to the smallest) each axis, centered.
+    Returns (fixed, moving, reconciliation), the last with the common shape
+    and the offset of each input in it (see `fit_to_shape`)"""
+
+    shape = common_shape([fixed_np.shape, moving_np.shape], mode)
+    fixed_np, fixed_offset = fit_to_shape(fixed_np, shape, value)
+    moving_np, moving_offset = fit_to_shape(moving_np, shape, value)
+
+    return (
+        fixed_np,
+        moving_np,
+        {
+            'shape': list(shape),
+            'fixed_offset': list(fixed_offset),
+            'moving_offset': list(moving_offset),
+        },
+    )
+
+
+def shift_header(header, offset):
+    """nifti affine of a volume whose voxel i is voxel i - offset of the one
+    with `header` (None = identity), `offset` in D, H, W ordering"""
+
+    if not any(offset):
+        return header
+
+    shift = np.eye(4)
+    shift[:3, 3] = [-o for o in reversed(offset)]  # nifti axes order
+    return (np.eye(4) if header is None else header) @ shift
+
+
+def pad_to_depth(x, depth, value='min'):
+    """pad (centered) along depth, assuming D, H, W ordering"""
+
+    if depth <= x.shape[0]:
+        return x
+
+    return fit_to_shape(x, (depth,) + x.shape[1:], value)[0]
+
+
+def depth_slab(x, depth, z0, z1, value):
+    """slab [z0, z1) of `x` once padded (as `pad_to_depth`) to `depth`,
+    without padding the whole volume"""
+
+    offset = (depth - x.shape[0]) // 2
+    out = np.full((z1 - z0,) + x.shape[1:], value, dtype=x.dtype)
+
+    s0, s1 = max(z0 - offset, 0), min(z1 - offset, x.shape[0])
+    if s1 > s0:
+        out[s0 + offset - z0 : s1 + offset - z0] = x[s0:s1]
+
+    return out
+
+
 def pad_smaller_along_depth(fixed_np, moving_np, value='min'):
     """assuming D, H, W ordering"""
 
@@ -40,31 +144,10 @@ def pad_smaller_along_depth(fixed_np, moving_np, value='min'):
         fixed_dimensions[1:] == moving_dimensions[1:]
     )  # image dimensions should be the same
 
-    fixed_z = fixed_dimensions[0]
-    moving_z = moving_dimensions[0]
-
-    if fixed_z != moving_z:
-        necessary_padding = max(fixed_z, moving_z) - min(fixed_z, moving_z)
-        padding_bottom = necessary_padding // 2
-        padding_top = necessary_padding - padding_bottom
-        padding = ((padding_bottom, padding_top), (0, 0), (0, 0))
-
-        if fixed_z < moving_z:
-            if value == 'min':
-                value = fixed_np.min()
-
-            fixed_np = np.pad(
-                fixed_np, padding, mode='constant', constant_values=value
-            )
-        else:
-            if value == 'min':
-                value = moving_np.min()
-
-            moving_np = np.pad(
-                moving_np, padding, mode='constant', constant_values=value
-            )
-
-    return fixed_np, moving_np
+    depth = max(fixed_dimensions[0], moving_dimensions[0])
+    return pad_to_depth(fixed_np, depth, value), pad_to_depth(
+        moving_np, depth, value
+    )
 
 
 def get_os_info():
@@ -81,7 +164,7 @@ def get_os_info():
 def create_sub_process(executableFilePath, cmdLineArguments):
     full_command = [executableFilePath] + cmdLineArguments
 
-    return subprocess.Popen(
+    process = subprocess.Popen(
         full_command,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
@@ -89,6 +172,52 @@ def create_sub_process(executableFilePath, cmdLineArguments):
         startupinfo=get_os_info(),
         # todo? shell=False
     )
+    process.start_time = time.perf_counter()  # for profiling
+    return process
+
+
+def wait_with_rusage(process, lock=None, poll_interval=0.05):
+    """like `process.wait()`, but also returns the child resource usage
+    (CPU times, max RSS) where `os.wait4` is available, else None.
+    The child is reaped (and `returncode` set) holding `lock`, so whoever
+    kills processes under it never signals a reaped, maybe reused, pid"""
+
+    if not hasattr(os, 'wait4'):
+        return process.wait(), None
+
+    while True:
+        with lock or contextlib.nullcontext():
+            try:
+                pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+            except ChildProcessError:  # already reaped by Popen
+                return process.wait(), None
+
+            if pid:
+                process.returncode = os.waitstatus_to_exitcode(status)
+                return process.returncode, rusage
+
+        time.sleep(poll_interval)
+
+
+def wait_sub_process(process, lock=None, on_line=None):
+    """blocks until `process` exits, without touching the GUI (so it can be
+    used from worker threads). Output lines are passed to `on_line` as they
+    come if given, else returned. Returns (return code, output, rusage)"""
+
+    lines = []
+    try:
+        for line in process.stdout:
+            if on_line is None:
+                lines.append(line)
+            else:
+                on_line(line.rstrip())
+    except UnicodeDecodeError:  # non-English locale, see `_handleProcess`
+        process.stdout.buffer.read()
+        lines = []
+
+    process.stdout.close()
+    return_code, rusage = wait_with_rusage(process, lock)
+    return return_code, ''.join(lines), rusage
 
 
 def np2nifty(x, out_path, affine=np.eye(4)):
@@ -37,7 +37,19 @@ class deedsBCVWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
 
         self._parameterNode = None
         self._parameterNodeGuiTag = None
-        self.registrationInProgress = False
+        self.registrationInProgress = 0  # running (or queued) requests
+        self._previewNode = None
+
+        # a click while registering queues a new request if the parameters
+        # changed since the last one, else cancels (see `onApplyButton`)
+        self._lastRequest = None
+        self._nRequests = 0
+
+        # outputs loaded in the scene after a registration, the others are
+        # only referenced (on disk) until `loadOutput` is called
+        self.outputsToLoad = ('deformed',)
+        self.outputReferences = {}
+        self.outputNodes = {}  # the ones loaded, by name
 
     def setup(self) -> None:
         """
@@ -57,7 +69,7 @@ class deedsBCVWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         self.logic = Logic()
         self.logic.logCallback = self.addLog
 
-        self.registrationInProgress = False
+        self.registrationInProgress = 0
 
     def _setupUI(self) -> None:
         uiWidget = slicer.util.loadUI(self.resourcePath('UI/deedsBCV.ui'))
@@ -192,29 +204,67 @@ class deedsBCVWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         self._updateApplyButtonState()
 
     def onApplyButton(self) -> None:
-        """Run processing when user clicks "Apply" button."""
+        """Run processing when user clicks "Apply" button.
+        While registering (this is called again from the events processed
+        meanwhile), a new request is queued if the parameters changed, in
+        place of any queued one, else all of them are cancelled."""
 
-        if self.registrationInProgress:
-            self.logic.cancelRequested = True
-            self.registrationInProgress = False
+        if self.registrationInProgress and not self._parametersChanged():
+            self.logic.cancel(requestGroup='widget')
         else:
             with slicer.util.tryWithErrorDisplay(
                 'Failed to compute results.', waitCursor=True
             ):
-                self.ui.statusLabel.plainText = ''
+                if not self.registrationInProgress:
+                    self.ui.statusLabel.plainText = ''
+
+                self._lastRequest = self._requestParameters()
+                self._nRequests += 1
+                request = self._nRequests
 
                 try:
-                    self.registrationInProgress = True
+                    self.registrationInProgress += 1
                     self._updateApplyButtonState()
 
-                    self.runLogicOrExcept()
+                    self.runLogicOrExcept(
+                        isLatest=lambda: request == self._nRequests
+                    )
                     self.onLogicSuccess()
                 finally:
-                    self.registrationInProgress = False
+                    self.registrationInProgress -= 1
+                    if not self.registrationInProgress:
+                        self._remove_preview()  # also if failed or cancelled
 
         self._updateApplyButtonState()
 
-    def runLogicOrExcept(self):
+    def _requestParameters(self):
+        node = self._parameterNode
+        return (
+            node.movingVolume and node.movingVolume.GetID(),
+            node.fixedVolume and node.fixedVolume.GetID(),
+            node.regularisationParameter,
+            node.numLevelsParameter,
+            node.gridSpacingParameter,
+            node.maxSearchRadiusParameter,
+            node.stepQuantisationParameter,
+            node.includeAffineStepParameter,
+            node.previewParameter,
+            self.ui.loadAffineCheckBox.checked
+            and str(node.affineParamsInputFilepath),
+            self.ui.loadDeformableCheckBox.checked
+            and str(node.deformableParamsInputFilepath),
+            self.ui.saveOutputsCheckBox.checked and str(node.outputFolder),
+        )
+
+    def _parametersChanged(self):
+        """since the last request"""
+
+        return self._requestParameters() != self._lastRequest
+
+    def runLogicOrExcept(self, isLatest=None):
+        """the result is not loaded if `isLatest()` is False by then (a newer
+        request was made meanwhile)"""
+
         if not self.ui.loadAffineCheckBox.checked:
             self._parameterNode.affineParamsInputFilepath = Path('')
 
@@ -228,34 +278,83 @@ class deedsBCVWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
             self._parameterNode,
             deleteTemporaryFiles=False,
             # deprecated, of course log! logToStdout=True
+            previewCallback=self._show_preview
+            if self._parameterNode.previewParameter
+            else None,
+            requestGroup='widget',  # newer clicks supersede queued ones
         )
 
-        if pred_path is not None:
-            self._post_process_or_except(tempDir, pred_path)
+        if pred_path is not None and (isLatest is None or isLatest()):
+            with self.logic.profiler.stage('load_back'):
+                self._post_process_or_except(tempDir, pred_path)
 
     def _post_process_or_except(self, tempDir, pred_path):
-        """parse outputs, save them, and, if possible, show them"""
+        """parse outputs: the ones in `outputsToLoad` are shown, the others
+        are kept as references (see `loadOutput`)"""
+
+        outputs = {
+            'fixed pre-processed': Path(tempDir)
+            / f'{Logic.FIXED_FILENAME}.nii.gz',
+            'moving pre-processed': Path(tempDir)
+            / f'{Logic.MOVING_FILENAME}.nii.gz',
+            'deformed': Path(pred_path),
+        }
+        if self.logic.inversePredPath is not None:
+            outputs['fixed deformed'] = Path(self.logic.inversePredPath)
+
+        self.outputReferences = {
+            name: path for name, path in outputs.items() if path.exists()
+        }
+        self.outputNodes = {}
+
+        for name in self.outputsToLoad:
+            if name in self.outputReferences:
+                self.loadOutput(name)
+
+    def loadOutput(self, name, show=True):
+        """loads (once) the output `name` of the last registration, returns
+        its node"""
+
+        node = self.outputNodes.get(name)
+        if node is not None and slicer.mrmlScene.IsNodePresent(node):
+            return node
+
+        if name not in self.outputReferences:
+            raise ValueError(
+                f'No output {name} in the last registration (outputs: '
+                f'{", ".join(self.outputReferences) or "none"})'
+            )
+
+        path = self.outputReferences[name]
         properties = {
+            'name': name,
             'singleFile': True,
             'discardOrientation': False,  # liver on bottom-left
             'autoWindowLevel': False,  # don't even need if using pre-processed data
-            'show': True,
+            'show': show,
         }
+        self.outputNodes[name] = slicer.util.loadVolume(
+            str(path), properties=properties
+        )
+        return self.outputNodes[name]
+
+    def _show_preview(self, pred_path):
+        self._remove_preview()
+
+        if Path(pred_path).exists():
+            self._previewNode = slicer.util.loadVolume(
+                pred_path,
+                properties={
+                    'name': 'deformed (preview)',
+                    'singleFile': True,
+                    'show': True,
+                },
+            )
 
-        fpath = Path(tempDir) / f'{self.FIXED_FILENAME}.nii.gz'
-        if fpath.exists():
-            properties['name'] = 'fixed pre-processed'
-            slicer.util.loadVolume(fpath, properties=properties)
-
-        fpath = Path(tempDir) / f'{self.MOVING_FILENAME}.nii.gz'
-        if fpath.exists():
-            properties['name'] = 'moving pre-processed'
-            slicer.util.loadVolume(fpath, properties=properties)
-
-        pred_path = Path(pred_path)
-        if pred_path.exists():
-            properties['name'] = 'deformed'
-            slicer.util.loadVolume(pred_path, properties=properties)
+    def _remove_preview(self):
+        if self._previewNode is not None:
+            slicer.mrmlScene.RemoveNode(self._previewNode)
+            self._previewNode = None
 
     def setStateApplyButton(self, enabled, text=None):
         if text is not None:
@@ -273,6 +372,8 @@ class deedsBCVWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         if self.registrationInProgress or self.logic.isRunning:
             if self.logic.cancelRequested:
                 self.disableApplyButton('Cancelling...')
+            elif self.registrationInProgress and self._parametersChanged():
+                self.enableApplyButton('Register (queued)')
             else:
                 self.enableApplyButton('Cancel')
         else: